@@ -21,6 +21,8 @@
 
 from . import generator
 from . import carrier_file
+from . import export_queue
 from . import stock
 from . import csv_writer
+from . import fixed_width_writer
 from . import wizard
@@ -34,6 +34,10 @@ The delivery orders can be grouped in one files
 or be exported each one in a separate file.
 The files can be generated automatically
 on the shipment of a Delivery Order or from a manual action.
+When generated automatically, the Delivery Orders can also be queued
+and exported in background by a scheduled action.
+A scheduled action can also export incrementally the Delivery Orders
+done since its last run.
 They are exported to a defined path or
 in a document directory of your choice if the "document" module is installed.
 
@@ -56,6 +60,8 @@ Sub-modules already exist to generate file according to specs of :
     'data': ['carrier_file_view.xml',
              'stock_view.xml',
              'wizard/generate_carrier_files_view.xml',
+             'export_queue_view.xml',
+             'carrier_file_data.xml',
              'security/ir.model.access.csv'],
     'demo': ['carrier_file_demo.xml',
              'carrier_file_demo.yml'],
@@ -21,9 +21,11 @@
 
 import os
 import logging
+from multiprocessing.pool import ThreadPool
 
 from openerp.osv import orm, fields
-from .generator import new_file_generator
+from .generator import new_file_generator, build_records
+from .generator.prefetched_record import parent_path
 from tools.translate import _
 
 
@@ -61,6 +63,37 @@ class CarrierFile(orm.Model):
                                            'is processed. If activated, each '
                                            'delivery order will be exported '
                                            'in a separate file.'),
+        'async_export': fields.boolean('Export in background',
+                                       help='When the files are exported at '
+                                            'the delivery order process, the '
+                                            'delivery orders are queued and '
+                                            'the files are generated later '
+                                            'by a scheduled action.'),
+        'stream_rows': fields.boolean('Stream rows to the file',
+                                      help='The rows are written in the '
+                                           'file by chunks while they are '
+                                           'generated instead of being '
+                                           'built in memory first. '
+                                           'Only used when the pickings '
+                                           'are grouped in one file.'),
+        'write_threads': fields.integer('Parallel file writes',
+                                        help='Number of files written at '
+                                             'the same time on the disk when '
+                                             'each picking is exported in a '
+                                             'separate file.'),
+        'incremental_export': fields.boolean(
+            'Incremental export',
+            help='A scheduled action exports the delivery orders done '
+                 'which have no file yet.'),
+        'last_export_date': fields.datetime('Last Exported Delivery Date',
+                                            readonly=True),
+        'last_export_picking_id': fields.many2one(
+            'stock.picking', 'Last Exported Delivery Order',
+            readonly=True, ondelete='set null'),
+    }
+
+    _defaults = {
+        'write_threads': 1,
     }
 
     def _write_file(self, cr, uid, carrier_file, filename, file_content,
@@ -72,7 +105,9 @@ class CarrierFile(orm.Model):
         :param browse_record carrier_file: browsable carrier.file
                                            (configuration)
         :param tuple filename: name of the file to write
-        :param tuple file_content: content of the file to write
+        :param tuple file_content: content of the file to write or
+                                   a function writing the content in
+                                   a file handle when rows are streamed
         :return: True if write is successful
         """
         if not carrier_file.export_path:
@@ -81,10 +116,179 @@ class CarrierFile(orm.Model):
                                    'for carrier file %s') %
                                  (carrier_file.name,))
         full_path = os.path.join(carrier_file.export_path, filename)
-        with open(full_path, 'w') as file_handle:
-            file_handle.write(file_content)
+        self._write_file_on_disk(full_path, file_content)
         return True
 
+    @staticmethod
+    def _write_file_on_disk(full_path, file_content):
+        """
+        Write the content of a file on the disk, it does not use
+        the ORM so it can be called from other threads
+
+        :param str full_path: path of the file to write
+        :param file_content: content of the file to write or
+                             a function writing the content in
+                             a file handle when rows are streamed
+        """
+        try:
+            with open(full_path, 'w') as file_handle:
+                if callable(file_content):
+                    file_content(file_handle)
+                else:
+                    file_handle.write(file_content)
+        except Exception:
+            # do not leave a partially streamed file on the disk
+            if callable(file_content) and os.path.exists(full_path):
+                os.remove(full_path)
+            raise
+
+    def _write_files(self, cr, uid, carrier_file, files, context=None):
+        """
+        Write the generated files one after the other with _write_file.
+        The errors are logged and returned, the other files are
+        still written.
+
+        :param browse_record carrier_file: browsable carrier file
+                                           configuration
+        :param list files: list of tuple (filename, file content,
+                           picking ids) as returned by the generator
+        :return: list of tuple (picking ids, error) for each file,
+                 error is None when the file has been written
+        """
+        log = logging.getLogger('delivery.carrier.file')
+        results = []
+        for filename, file_content, picking_ids in files:
+            # we pass the errors because the files can still be
+            # generated manually
+            try:
+                if self._write_file(cr, uid, carrier_file, filename,
+                                    file_content, context=context):
+                    results.append((picking_ids, None))
+                else:
+                    results.append((picking_ids,
+                                    _('The file %s has not been written') %
+                                    (filename,)))
+            except Exception as e:
+                log.exception("Could not create the picking file "
+                              "for pickings %s: %s",
+                              picking_ids, e)
+                results.append((picking_ids, e))
+        return results
+
+    def _write_files_threaded(self, cr, uid, carrier_file, files,
+                              context=None):
+        """
+        Write the generated files on the disk with a pool of
+        carrier_file.write_threads threads, only the disk I/O happens
+        in the threads.
+
+        :param browse_record carrier_file: browsable carrier file
+                                           configuration
+        :param list files: list of tuple (filename, file content,
+                           picking ids) as returned by the generator
+        :return: list of tuple (picking ids, error) for each file,
+                 error is None when the file has been written
+        """
+        if not carrier_file.export_path:
+            raise orm.except_orm(_('Error'),
+                                 _('Export path is not defined '
+                                   'for carrier file %s') %
+                                 (carrier_file.name,))
+        export_path = carrier_file.export_path
+        log = logging.getLogger('delivery.carrier.file')
+
+        def write(generated_file):
+            filename, file_content, picking_ids = generated_file
+            try:
+                self._write_file_on_disk(os.path.join(export_path, filename),
+                                         file_content)
+            except Exception as e:
+                log.exception("Could not create the picking file "
+                              "for pickings %s: %s",
+                              picking_ids, e)
+                return picking_ids, e
+            return picking_ids, None
+
+        pool = ThreadPool(min(carrier_file.write_threads, len(files)))
+        try:
+            return pool.map(write, files)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _prefetch_pickings(self, cr, uid, file_generator, picking_ids,
+                           context=None):
+        """
+        Read in bulk the fields needed by the file generator on the
+        pickings and their relations, with one read() per relation path
+        whatever the number of pickings.
+
+        :param file_generator: generator of the files, the fields to read
+                               are declared in its prefetch_fields
+        :param list picking_ids: list of ids of pickings for which
+                                 we have to generate a file
+        :return: list of records in the same order than picking_ids,
+                 browse records when the generator does not declare
+                 any prefetch_fields
+        """
+        picking_obj = self.pool.get('stock.picking')
+        fields_by_path = file_generator.prefetch_fields
+        if not fields_by_path:
+            return [picking for picking in
+                    picking_obj.browse(cr, uid, picking_ids, context=context)]
+        fields_by_path = dict((path, set(fields)) for path, fields
+                              in fields_by_path.iteritems())
+        fields_by_path.setdefault('', set())
+        # the many2one followed by a path must be read on its parent
+        for path in fields_by_path.keys():
+            while path:
+                parent, field = parent_path(path)
+                fields_by_path.setdefault(parent, set()).add(field)
+                path = parent
+
+        models = {'': picking_obj}
+        values_by_path = {}
+        for path in sorted(fields_by_path, key=lambda p: p.count('.')
+                           if p else -1):
+            if path:
+                parent, field = parent_path(path)
+                parent_model = models[parent]
+                column = parent_model._all_columns[field].column
+                model = models[path] = self.pool.get(column._obj)
+                ids = set(values[field][0] for values
+                          in values_by_path[parent].itervalues()
+                          if values.get(field))
+            else:
+                model = picking_obj
+                ids = picking_ids
+            values_by_path[path] = {}
+            if ids:
+                for values in model.read(cr, uid, list(ids),
+                                         list(fields_by_path[path]),
+                                         context=context):
+                    values_by_path[path][values['id']] = values
+        # the fields not declared by the generator are read on browse
+        # records, browsed at once for all the records of a path
+        browsed = {}
+
+        def browser(path):
+            def browse(record_id):
+                if path not in browsed:
+                    ids = list(values_by_path[path])
+                    browsed[path] = dict(
+                        (record.id, record) for record in
+                        models[path].browse(cr, uid, ids, context=context))
+                return browsed[path][record_id]
+            return browse
+
+        records = build_records(
+            values_by_path,
+            models_by_path=models,
+            browse_by_path=dict((path, browser(path))
+                                for path in values_by_path))
+        return [records[picking_id] for picking_id in picking_ids
+                if picking_id in records]
+
     def _generate_files(self, cr, uid, carrier_file, picking_ids,
                         context=None):
         """
@@ -95,38 +299,43 @@ class CarrierFile(orm.Model):
                                            configuration
         :param list picking_ids: list of ids of pickings for which
                                  we have to generate a file
-        :return: True if successful
+        :return: list of tuple (picking ids, error message) for
+                 the files which could not be written, empty when
+                 all the files have been written
         """
         if context is None:
             context = {}
         picking_obj = self.pool.get('stock.picking')
-        log = logging.getLogger('delivery.carrier.file')
         file_generator = new_file_generator(carrier_file.type)
-        pickings = [picking for picking in
-                    picking_obj.browse(cr, uid, picking_ids, context=context)]
+        pickings = self._prefetch_pickings(cr, uid, file_generator,
+                                           picking_ids, context=context)
         # must return a list of generated pickings ids to update
         files = file_generator.generate_files(pickings, carrier_file)
         if carrier_file.auto_export:
             context['picking_id'] = pickings and pickings[0].id
-        for f in files:
-            filename, file_content, picking_ids = f
-            # we pass the errors because the files can still be
-            # generated manually
-            # at first I would like to open a new cursor and
-            # commit the write after each file created
-            # but I encountered lock because the picking
-            # was already modified in the current transaction
-            try:
-                if self._write_file(cr, uid, carrier_file, filename,
-                                    file_content, context=context):
-                    picking_obj.write(cr, uid, picking_ids,
-                                      {'carrier_file_generated': True},
-                                      context=context)
-            except Exception as e:
-                log.exception("Could not create the picking file "
-                              "for pickings %s: %s",
-                              picking_ids, e)
-        return True
+        if (carrier_file.write_mode == 'disk' and
+                carrier_file.write_threads > 1 and len(files) > 1):
+            results = self._write_files_threaded(cr, uid, carrier_file,
+                                                 files, context=context)
+        else:
+            results = self._write_files(cr, uid, carrier_file, files,
+                                        context=context)
+        # at first I would like to open a new cursor and
+        # commit the write after each file created
+        # but I encountered lock because the picking
+        # was already modified in the current transaction
+        generated_ids = []
+        failures = []
+        for picking_ids, error in results:
+            if error is None:
+                generated_ids += picking_ids
+            else:
+                failures.append((picking_ids, unicode(error)))
+        if generated_ids:
+            picking_obj.write(cr, uid, generated_ids,
+                              {'carrier_file_generated': True},
+                              context=context)
+        return failures
 
     def generate_files(self, cr, uid, carrier_file_id, picking_ids,
                        context=None):
@@ -139,7 +348,9 @@ class CarrierFile(orm.Model):
         :param int carrier_file_id: id of the carrier file configuration
         :param list picking_ids: list of ids of pickings for
                                  which we have to generate a file
-        :return: True if successful
+        :return: list of tuple (picking ids, error message) for
+                 the files which could not be written, empty when
+                 all the files have been written
         """
         if not isinstance(carrier_file_id, (int, long)):
             if len(carrier_file_id) > 1:
@@ -151,6 +362,75 @@ class CarrierFile(orm.Model):
         return self._generate_files(cr, uid, carrier_file, picking_ids,
                                     context=context)
 
+    def _get_incremental_picking_ids(self, cr, uid, carrier_file, limit,
+                                     context=None):
+        """
+        Return the delivery orders done of a carrier file configuration
+        which have no file yet, ordered by date done and id (uses the
+        partial index on stock_picking).
+
+        The delivery orders are not selected after the last exported
+        one: a delivery order committed after a delivery order done later
+        has been exported must be exported too.
+
+        :param browse_record carrier_file: browsable carrier file
+                                           configuration
+        :param int limit: maximal number of pickings to return
+        :return: list of tuple (picking id, date done)
+        """
+        query = ("SELECT p.id, p.date_done FROM stock_picking p "
+                 "JOIN delivery_carrier c ON c.id = p.carrier_id "
+                 "WHERE c.carrier_file_id = %s "
+                 "AND p.type = 'out' AND p.state = 'done' "
+                 "AND NOT COALESCE(p.carrier_file_generated, false) "
+                 "ORDER BY p.date_done, p.id LIMIT %s")
+        cr.execute(query, (carrier_file.id, limit))
+        return cr.fetchall()
+
+    def run_incremental_export(self, cr, uid, ids=None, batch_size=500,
+                               context=None):
+        """
+        Scheduled action: export the delivery orders done without file
+        of the configurations set as "incremental_export" and keep the
+        last delivery order exported.
+
+        The export stops on the first batch with a file which could not
+        be written, its delivery orders are exported again on the next
+        run.
+        """
+        if ids is None:
+            ids = self.search(cr, uid, [('incremental_export', '=', True)],
+                              context=context)
+        log = logging.getLogger('delivery.carrier.file')
+        for carrier_file_id in ids:
+            while True:
+                carrier_file = self.browse(cr, uid, carrier_file_id,
+                                           context=context)
+                rows = self._get_incremental_picking_ids(
+                    cr, uid, carrier_file, batch_size, context=context)
+                if not rows:
+                    break
+                failures = self.generate_files(
+                    cr, uid, carrier_file_id,
+                    [picking_id for picking_id, __ in rows],
+                    context=context)
+                failed_ids = set(picking_id for picking_ids, __ in failures
+                                 for picking_id in picking_ids)
+                last_export = None
+                for picking_id, date_done in rows:
+                    if picking_id not in failed_ids:
+                        last_export = {'last_export_date': date_done,
+                                       'last_export_picking_id': picking_id}
+                if last_export:
+                    self.write(cr, uid, [carrier_file_id], last_export,
+                               context=context)
+                if failed_ids:
+                    log.warning("Incremental export of carrier file %s "
+                                "stopped on failures: %s",
+                                carrier_file.name, failures)
+                    break
+        return True
+
 
 class delivery_carrier(orm.Model):
     _inherit = 'delivery.carrier'
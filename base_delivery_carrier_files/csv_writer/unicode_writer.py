@@ -1,6 +1,7 @@
 # CSV writer from python doc
 import csv
 import codecs
+from itertools import islice
 
 try:
     import cStringIO as StringIO
@@ -13,29 +14,50 @@ class UnicodeWriter(object):
     """
     A CSV writer which will write rows to CSV file "f",
     which is encoded in the given encoding.
+
+    writerows serializes the rows by blocks of block_size rows
+    and encodes each block at once in the target encoding.
     """
 
+    # number of rows serialized and encoded at once by writerows
+    block_size = 1000
+
     def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
         # Redirect output to a queue
         self.queue = StringIO.StringIO()
         self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
         self.stream = f
         self.encoder = codecs.getincrementalencoder(encoding)()
+        # the queue is already encoded in utf-8
+        self.reencode = codecs.lookup(encoding).name != 'utf-8'
 
-    def writerow(self, row):
+    @staticmethod
+    def _encode_row(row):
         # we ensure that we do not try to encode none or bool
-        row = [x or u'' for x in row]
-        self.writer.writerow([s.encode("utf-8") for s in row])
+        return [(s or u'').encode("utf-8") for s in row]
+
+    def _flush_queue(self):
         # Fetch UTF-8 output from the queue ...
         data = self.queue.getvalue()
-        data = data.decode("utf-8")
-        # ... and reencode it into the target encoding
-        data = self.encoder.encode(data)
+        if self.reencode:
+            # ... and reencode it into the target encoding
+            data = self.encoder.encode(data.decode("utf-8"))
         # write to the target stream
         self.stream.write(data)
         # empty queue
+        self.queue.seek(0)
         self.queue.truncate(0)
 
+    def writerow(self, row):
+        self.writer.writerow(self._encode_row(row))
+        self._flush_queue()
+
     def writerows(self, rows):
-        for row in rows:
-            self.writerow(row)
+        rows = iter(rows)
+        encode_row = self._encode_row
+        while True:
+            block = [encode_row(row) for row in islice(rows, self.block_size)]
+            if not block:
+                break
+            self.writer.writerows(block)
+            self._flush_queue()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+
+from openerp.osv import orm, fields
+
+_logger = logging.getLogger(__name__)
+
+
+class CarrierFileExportQueue(orm.Model):
+
+    """
+    Pickings waiting to be exported in a carrier file.
+    When a carrier file is configured to be exported in background,
+    the delivery orders are put in this queue when they are processed
+    and the files are generated by a scheduled action.
+    """
+
+    _name = 'delivery.carrier.file.export.queue'
+    _description = 'Carrier files export queue'
+    _order = 'id'
+
+    _columns = {
+        'picking_id': fields.many2one('stock.picking', 'Delivery Order',
+                                      required=True, readonly=True,
+                                      ondelete='cascade'),
+        'carrier_file_id': fields.many2one('delivery.carrier.file',
+                                           'Carrier File',
+                                           required=True, readonly=True,
+                                           ondelete='cascade'),
+        'state': fields.selection([('pending', 'Pending'),
+                                   ('failed', 'Failed')],
+                                  'State', required=True, readonly=True),
+        'error': fields.text('Error', readonly=True),
+    }
+
+    _defaults = {
+        'state': 'pending',
+    }
+
+    def enqueue(self, cr, uid, carrier_file_id, picking_ids, context=None):
+        """
+        Put pickings in the queue of a carrier file configuration,
+        the pickings already waiting in the queue are not added twice.
+
+        :param int carrier_file_id: id of the carrier file configuration
+        :param list picking_ids: list of ids of pickings to export
+        :return: list of ids of the created queue entries
+        """
+        queued_ids = self.search(cr, uid,
+                                 [('carrier_file_id', '=', carrier_file_id),
+                                  ('picking_id', 'in', picking_ids),
+                                  ('state', '=', 'pending')],
+                                 context=context)
+        queued_picking_ids = set(
+            entry['picking_id'][0] for entry in
+            self.read(cr, uid, queued_ids, ['picking_id'], context=context))
+        return [self.create(cr, uid,
+                            {'carrier_file_id': carrier_file_id,
+                             'picking_id': picking_id},
+                            context=context)
+                for picking_id in picking_ids
+                if picking_id not in queued_picking_ids]
+
+    def action_retry(self, cr, uid, ids, context=None):
+        """ Put back the failed exports in the queue """
+        return self.write(cr, uid, ids, {'state': 'pending', 'error': False},
+                          context=context)
+
+    def _export_batch(self, cr, uid, entries, context=None):
+        """
+        Generate the files of a batch of queue entries, grouped
+        by carrier file configuration. The exported entries are removed
+        from the queue, the others are marked as failed.
+        The pickings which already have their file, exported manually
+        since they have been queued for instance, are only removed
+        from the queue.
+
+        :param list entries: result of read() of the queue entries
+                             with the picking_id and carrier_file_id fields
+        """
+        carrier_file_obj = self.pool.get('delivery.carrier.file')
+        picking_obj = self.pool.get('stock.picking')
+        by_carrier_file = {}
+        for entry in entries:
+            carrier_file_id = entry['carrier_file_id'][0]
+            by_carrier_file.setdefault(carrier_file_id, {})[
+                entry['picking_id'][0]] = entry['id']
+        for carrier_file_id, entry_ids in by_carrier_file.iteritems():
+            exported_ids = picking_obj.search(
+                cr, uid,
+                [('id', 'in', entry_ids.keys()),
+                 ('carrier_file_generated', '=', True)],
+                context=context)
+            exported_entry_ids = [entry_ids.pop(picking_id)
+                                  for picking_id in exported_ids]
+            failures = []
+            if entry_ids:
+                try:
+                    failures = carrier_file_obj.generate_files(
+                        cr, uid, carrier_file_id, entry_ids.keys(),
+                        context=context)
+                except Exception as e:
+                    _logger.exception("Could not export the carrier file %s",
+                                      carrier_file_id)
+                    cr.rollback()
+                    failures = [(entry_ids.keys(), unicode(e))]
+            for picking_ids, error in failures:
+                failed_ids = [entry_ids.pop(picking_id)
+                              for picking_id in picking_ids
+                              if picking_id in entry_ids]
+                self.write(cr, uid, failed_ids,
+                           {'state': 'failed', 'error': error},
+                           context=context)
+            self.unlink(cr, uid, entry_ids.values() + exported_entry_ids,
+                        context=context)
+            cr.commit()
+
+    def run_export_queue(self, cr, uid, batch_size=500, context=None):
+        """
+        Scheduled action: generate the files of the queued pickings
+        by batches of batch_size pickings until the queue is empty.
+        The transaction is committed after each carrier file of a batch,
+        so the generated files stay flagged even if a later batch fails.
+        """
+        while True:
+            queue_ids = self.search(cr, uid, [('state', '=', 'pending')],
+                                    limit=batch_size, context=context)
+            if not queue_ids:
+                break
+            entries = self.read(cr, uid, queue_ids,
+                                ['picking_id', 'carrier_file_id'],
+                                context=context)
+            self._export_batch(cr, uid, entries, context=context)
+        return True
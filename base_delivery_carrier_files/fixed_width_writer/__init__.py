@@ -0,0 +1 @@
+from .fixed_width_writer import FixedWidthWriter
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from itertools import islice
+
+
+class FixedWidthWriter(object):
+
+    """
+    A writer of fixed width (positional) records in file "f".
+
+    The layout of the records is the one of a BaseLine subclass,
+    every column must have a width. The line class also defines
+    the padding character, the alignment of the columns and the
+    encoding of the file, e.g.
+
+    class MyLine(BaseLine):
+        fields = (('reference', 10),
+                  ('', 2),
+                  ('weight', 6))
+        padding = ' '
+        alignment = 'left'
+        field_alignments = {'weight': 'right'}
+        encoding = 'latin-1'
+
+    The widths are counted in characters, use a single-byte encoding
+    when the specifications count the positions in bytes.
+
+    The rows are rendered as unicode and encoded once per block
+    of rows, straight to the target stream.
+    """
+
+    # number of rows encoded and written at once by writerows
+    block_size = 1000
+
+    def __init__(self, f, line_class, lineterminator='\n',
+                 encoding=None, errors='strict'):
+        self.stream = f
+        self.lineterminator = unicode(lineterminator)
+        self.encoding = encoding or line_class.encoding
+        self.errors = errors
+        self.padding = unicode(line_class.padding)
+        self.columns = []
+        for field_name, width in line_class._layout:
+            if not width:
+                raise ValueError("Field %s must have a width to be written "
+                                 "in a fixed width record" % (field_name,))
+            alignment = line_class.field_alignments.get(
+                field_name, line_class.alignment)
+            if alignment not in ('left', 'right'):
+                raise ValueError("Wrong alignment %s for field %s" %
+                                 (alignment, field_name))
+            self.columns.append((width, alignment == 'right'))
+
+    def format_row(self, row):
+        """
+        Render a row as a unicode record, without line terminator
+
+        :param list row: values of the row as returned
+                         by BaseLine.get_fields
+        :return: the record as unicode
+        """
+        padding = self.padding
+        parts = []
+        for value, (width, right) in zip(row, self.columns):
+            if not value:
+                value = u''
+            elif isinstance(value, str):
+                value = value.decode('utf-8')
+            value = value[0:width]
+            if right:
+                parts.append(value.rjust(width, padding))
+            else:
+                parts.append(value.ljust(width, padding))
+        return u''.join(parts)
+
+    def writerow(self, row):
+        self.writerows([row])
+
+    def writerows(self, rows):
+        rows = iter(rows)
+        terminator = self.lineterminator
+        while True:
+            block = [self.format_row(row) + terminator
+                     for row in islice(rows, self.block_size)]
+            if not block:
+                break
+            self.stream.write(u''.join(block).encode(self.encoding,
+                                                     self.errors))
@@ -22,4 +22,6 @@
 from .base_line import BaseLine
 from .file_generator import new_file_generator
 from .file_generator import CarrierFileGenerator
+from .file_generator import register_file_generator
+from .prefetched_record import PrefetchedRecord, NullRecord, build_records
 from . import generic_generator
@@ -20,6 +20,73 @@
 ##############################################################################
 
 
+def _field_definition(field):
+    """
+    Return the field name and its max length (optional)
+    as declared in the class for one slot of the class attribute "fields"
+
+    :param field: a field has it is defined in
+                  the class attribute "fields"
+    :return: field name and its optional max length
+    """
+    width = False
+    if field in (False, None):
+        field_name = ''
+    elif isinstance(field, tuple):
+        field_name, width = field
+    elif isinstance(field, str):
+        field_name = field
+    else:
+        raise ValueError("Wrong field definition for field %s" % (field,))
+    return field_name, width
+
+
+class BaseLineMeta(type):
+
+    """
+    Compile the layout of the class attribute "fields" once
+    when a BaseLine subclass is created:
+
+    * _layout: tuple of (field name, width) for each column
+    * _field_names: names of the columns which are not empty
+    * __slots__: one slot per field name, so the lines do not
+      carry a __dict__
+
+    A class attribute named like a field is used as default
+    value of the field instead of ''.
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        fields = attrs.get('fields')
+        if fields is None:
+            fields = next((base.fields for base in bases
+                           if hasattr(base, 'fields')), ())
+        layout = tuple(_field_definition(field) for field in fields)
+        field_names = []
+        for field_name, __ in layout:
+            if field_name and field_name not in field_names:
+                field_names.append(field_name)
+
+        inherited_slots = set()
+        for base in bases:
+            for klass in base.__mro__:
+                inherited_slots.update(getattr(klass, '__slots__', ()))
+        defaults = {}
+        for base in reversed(bases):
+            defaults.update(getattr(base, '_defaults', {}))
+        for field_name in field_names:
+            if field_name in attrs:
+                defaults[field_name] = attrs.pop(field_name)
+        if '__slots__' not in attrs:
+            attrs['__slots__'] = tuple(field_name for field_name
+                                       in field_names
+                                       if field_name not in inherited_slots)
+        attrs['_layout'] = layout
+        attrs['_field_names'] = tuple(field_names)
+        attrs['_defaults'] = defaults
+        return super(BaseLineMeta, mcs).__new__(mcs, name, bases, attrs)
+
+
 class BaseLine(object):
 
     """
@@ -35,6 +102,14 @@ class BaseLine(object):
 
     Empty fields '' can be used to leave columns empty.
 
+    The definition of the fields is compiled once per class
+    (see BaseLineMeta), the lines only accept the attributes
+    declared in "fields".
+
+    The "padding", "alignment", "field_alignments" and "encoding"
+    class variables are used when the rows are written as fixed width
+    records (see FixedWidthWriter).
+
     This class has purpose to be subclassed e.g.
 
     class MyLine(BaseLine):
@@ -70,8 +145,16 @@ class BaseLine(object):
     row.get_fields()
     => ['x', 'long']
     """
+    __metaclass__ = BaseLineMeta
+
     fields = ()
 
+    # layout of the records when written by the FixedWidthWriter
+    padding = ' '
+    alignment = 'left'
+    field_alignments = {}
+    encoding = 'utf-8'
+
     def __init__(self):
         """
         Create an instance attribute for each field
@@ -81,32 +164,11 @@ class BaseLine(object):
         """
         if not self.fields:
             raise ValueError("Fields Missing")
-        for field in self.fields:
-            field_name, _ = self._field_definition(field)
-            if not field_name:
-                continue
-            setattr(self, field_name, '')
+        defaults = self._defaults
+        for field_name in self._field_names:
+            setattr(self, field_name, defaults.get(field_name, ''))
 
-    @staticmethod
-    def _field_definition(field):
-        """
-        Return the field name and its max length (optional)
-        as declared in the class for one slot of the class attribute "fields"
-
-        :param field: a field has it is defined in
-                      the class attribute "fields"
-        :return: field name and its optional max length
-        """
-        width = False
-        if field in (False, None):
-            field_name = ''
-        elif isinstance(field, tuple):
-            field_name, width = field
-        elif isinstance(field, str):
-            field_name = field
-        else:
-            raise ValueError("Wrong field definition for field %s" % (field,))
-        return field_name, width
+    _field_definition = staticmethod(_field_definition)
 
     def get_fields(self):
         """
@@ -119,19 +181,19 @@ class BaseLine(object):
                  order of the class attribute "fields"
         """
         res = []
-        for field in self.fields:
-            field_name, width = self._field_definition(field)
-            if field_name:
-                value = getattr(self, field_name)
-                if value in (False, None):
-                    value = ''
-                elif not isinstance(value, (str, unicode)):
-                    value = unicode(value)
-                if width:
-                    value = value[0:width]
-            else:
+        append = res.append
+        for field_name, width in self._layout:
+            if not field_name:
+                append('')
+                continue
+            value = getattr(self, field_name)
+            if value in (False, None):
                 value = ''
-            res.append(value)
+            elif not isinstance(value, basestring):
+                value = unicode(value)
+            if width:
+                value = value[0:width]
+            append(value)
         return res
 
     def get_header(self):
@@ -141,8 +203,4 @@ class BaseLine(object):
 
         :return: a list of field names
         """
-        res = []
-        for field in self.fields:
-            field_name, _ = self._field_definition(field)
-            res.append(field_name)
-        return res
+        return [field_name for field_name, __ in self._layout]
@@ -27,14 +27,78 @@ except ImportError:
     import StringIO
 
 
+# generator classes by carrier type
+_generator_registry = {}
+# generator instances by carrier type, reset when a generator is registered
+_generator_instances = {}
+
+
+def register_file_generator(carrier_name, cls):
+    """
+    Register a generator class for a carrier type, a generator
+    registered later for the same type replaces the previous one.
+
+    :param str carrier_name: type of the carrier file
+    :param cls: subclass of CarrierFileGenerator
+    """
+    _generator_registry[carrier_name] = cls
+    _generator_instances.clear()
+
+
+class CarrierFileGeneratorType(type):
+
+    """
+    Register the CarrierFileGenerator subclasses which have
+    a carrier_type when they are created. The carrier_type can be
+    inherited, so a subclass of a generator replaces its parent.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(CarrierFileGeneratorType, cls).__init__(name, bases, attrs)
+        carrier_type = getattr(cls, 'carrier_type', None)
+        if carrier_type:
+            register_file_generator(carrier_type, cls)
+
+
 class CarrierFileGenerator(object):
 
+    """
+    Base class of the carrier file generators.
+
+    The subclasses define the type of carrier file they generate
+    in carrier_type, they are then registered at import and
+    returned by new_file_generator for this type. The subclasses of
+    a generator inherit its carrier_type and are returned instead.
+    """
+    __metaclass__ = CarrierFileGeneratorType
+
+    # type of the carrier file (delivery.carrier.file.type)
+    carrier_type = None
+
+    # number of rows rendered at once when the rows are streamed to the file
+    rows_chunk_size = 1000
+
+    # fields read in bulk on the pickings and their relations before
+    # the generation, as {relation path: [field names]} like
+    # {'': ['name', 'partner_id'], 'partner_id': ['name', 'country_id'],
+    #  'partner_id.country_id': ['code']}
+    # the many2one fields must have their own path to be followed.
+    # When empty, the generator receives browse records.
+    # The fields not declared here are still read, on browse records,
+    # so inherited generators can read more fields than their parent.
+    prefetch_fields = None
+
     def __init__(self, carrier_name):
         self.carrier_name = carrier_name
 
     @classmethod
     def carrier_for(cls, carrier_name):
-        return False
+        """
+        Return True if the class generates the files for this
+        carrier type. Only used for the generators which do not
+        have a carrier_type.
+        """
+        return bool(cls.carrier_type) and cls.carrier_type == carrier_name
 
     @staticmethod
     def sanitize_filename(name):
@@ -66,6 +130,8 @@ class CarrierFileGenerator(object):
         :return: list of tuple with files to create like:
                  [('filename1', file, [picking ids]),
                   ('filename2', file2, [picking ids])]
+                 when the rows are streamed, the file is a function
+                 which writes the content in a file handle
         """
         if configuration.group_pickings:
             return self._generate_files_grouped(pickings, configuration)
@@ -184,18 +250,92 @@ class CarrierFileGenerator(object):
                   ('filename2', file2, [picking ids])]
         """
         files = []
-        rows = []
         filename = self._get_filename_grouped(configuration)
         filename = self.sanitize_filename(filename)
-        for picking in pickings:
-            rows += self._get_rows(picking, configuration)
-        file_content = self._get_file(rows, configuration)
+        rows = self._iter_rows(pickings, configuration)
+        if configuration.stream_rows:
+            file_content = self._get_file_stream(rows, configuration)
+        else:
+            file_content = self._get_file(list(rows), configuration)
         files.append((filename, file_content, [p.id for p in pickings]))
         return files
 
+    def _iter_rows(self, pickings, configuration):
+        """
+        Generator of the rows of all the pickings, the rows of a picking
+        are only built when the previous ones have been consumed
+
+        :param browse_record pickings: list of browsable pickings records
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :return: generator of rows
+        """
+        for picking in pickings:
+            for row in self._get_rows(picking, configuration):
+                yield row
+
+    def _get_file_stream(self, rows, configuration):
+        """
+        Return a function which writes the rows in a file handle
+        chunk by chunk instead of the content of the file.
+        Each chunk of rows is rendered with _get_file so _write_rows
+        must not write anything else than the rows (headers, ...).
+
+        :param rows: iterable of rows to write in the file
+        :param browse_record configuration: configuration of
+                                            the file to generate
+        :return: function accepting the file handle to write in
+        """
+        def write_file(file_handle):
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= self.rows_chunk_size:
+                    file_handle.write(self._get_file(chunk, configuration))
+                    chunk = []
+            if chunk:
+                file_handle.write(self._get_file(chunk, configuration))
+        return write_file
+
+
+def _all_subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        for nested in _all_subclasses(subclass):
+            yield nested
+
+
+def _find_file_generator(carrier_name):
+    """
+    Return the generator class for a carrier type, looking in the
+    registry first, then asking the generators which only
+    implement carrier_for (the result is registered).
+    """
+    cls = _generator_registry.get(carrier_name)
+    if cls is None:
+        for subclass in _all_subclasses(CarrierFileGenerator):
+            if not subclass.carrier_type and \
+                    subclass.carrier_for(carrier_name):
+                cls = subclass
+                register_file_generator(carrier_name, cls)
+                break
+    return cls
+
 
 def new_file_generator(carrier_name):
-    for cls in CarrierFileGenerator.__subclasses__():
-        if cls.carrier_for(carrier_name):
-            return cls(carrier_name)
-    raise ValueError
+    """
+    Return the generator for a carrier type. The generators do not keep
+    any state so one instance is shared for each carrier type.
+
+    :param str carrier_name: type of the carrier file
+    :return: instance of the CarrierFileGenerator subclass
+             registered for this type
+    """
+    generator = _generator_instances.get(carrier_name)
+    if generator is None:
+        cls = _find_file_generator(carrier_name)
+        if cls is None:
+            raise ValueError("No carrier file generator is registered "
+                             "for the type %s" % (carrier_name,))
+        generator = _generator_instances[carrier_name] = cls(carrier_name)
+    return generator
@@ -45,9 +45,16 @@ class GenericLine(BaseLine):
 
 class LaPosteFileGenerator(CarrierFileGenerator):
 
-    @classmethod
-    def carrier_for(cls, carrier_name):
-        return carrier_name == 'generic'
+    carrier_type = 'generic'
+
+    prefetch_fields = {
+        '': ['name', 'weight'],
+        'partner_id': ['name', 'street', 'street2', 'zip', 'city',
+                       'phone', 'mobile', 'email', 'fax'],
+        'partner_id.state_id': ['name'],
+        'partner_id.country_id': ['code'],
+        'carrier_id': ['name'],
+    }
 
     def _get_rows(self, picking, configuration):
         """
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+
+class PrefetchedRecord(object):
+
+    """
+    Read-only record built from the values returned by a read().
+    It gives the same attribute access as a browse record on the
+    fields which have been prefetched, so the generators can use
+    them the same way, without any query.
+
+    The many2one fields are other PrefetchedRecord, or a NullRecord
+    when they are empty, as soon as their relation is prefetched too.
+
+    The fields which have not been prefetched are read on the browse
+    record returned by the browse function, when one is given.
+    """
+    __slots__ = ('id', '_values', '_browse')
+
+    def __init__(self, record_id, values, browse=None):
+        self.id = record_id
+        self._values = values
+        self._browse = browse
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            if self._browse is None:
+                raise AttributeError("Field %s has not been prefetched" %
+                                     name)
+        value = getattr(self._browse(self.id), name)
+        self._values[name] = value
+        return value
+
+    def __repr__(self):
+        return "PrefetchedRecord(%s)" % self.id
+
+
+class NullRecord(object):
+
+    """
+    Empty many2one value, like the browse_null of the ORM,
+    it evaluates to False and all its fields are None.
+
+    When the model is given, its many2one fields are other NullRecord
+    and its one2many and many2many fields are empty lists, so the
+    relations can be followed as on a browse_null.
+    """
+    __slots__ = ('_model',)
+
+    id = False
+
+    def __init__(self, model=None):
+        self._model = model
+
+    def __getattr__(self, name):
+        if self._model is None:
+            return None
+        field = self._model._all_columns.get(name)
+        if field is None:
+            return None
+        column = field.column
+        if column._type == 'many2one':
+            return NullRecord(self._model.pool.get(column._obj))
+        if column._type in ('one2many', 'many2many'):
+            return []
+        return None
+
+    def __nonzero__(self):
+        return False
+
+    def __repr__(self):
+        return "NullRecord()"
+
+
+NULL_RECORD = NullRecord()
+
+
+def parent_path(path):
+    """
+    Split a relation path in its parent path and its last field
+
+    :param str path: relation path like 'address_id.country_id'
+    :return: tuple ('address_id', 'country_id')
+    """
+    parent, __, field = path.rpartition('.')
+    return parent, field
+
+
+def _is_relational(model, field, value):
+    """
+    Return True if a value read by read() is a relation
+    (many2one, one2many or many2many)
+    """
+    if model is None:
+        # many2one are read as tuple (id, name), x2many as lists of ids
+        return isinstance(value, (tuple, list))
+    column = model._all_columns.get(field)
+    return (column is not None and
+            column.column._type in ('many2one', 'one2many', 'many2many'))
+
+
+def build_records(values_by_path, models_by_path=None, browse_by_path=None):
+    """
+    Link together the values read for each relation path
+    and returns the PrefetchedRecord of the root path ('')
+
+    :param dict values_by_path: {relation path: {id: read values}},
+                                relation paths are the many2one fields
+                                followed from the root records like
+                                'partner_id' or 'partner_id.country_id'
+    :param dict models_by_path: optional {relation path: model}, used
+                                to find the relations in the values and
+                                for the empty many2one values
+    :param dict browse_by_path: optional {relation path: function
+                                returning the browse record of an id},
+                                used for the fields not prefetched
+    :return: dict {id: PrefetchedRecord} of the root records
+
+    The relations which are not linked to a prefetched path are not kept
+    as read, they are read on the browse records like the fields not
+    prefetched.
+    """
+    models_by_path = models_by_path or {}
+    browse_by_path = browse_by_path or {}
+    records_by_path = {}
+    # build the deepest relations first so they can be linked
+    # to their parent records
+    for path in sorted(values_by_path,
+                       key=lambda p: p.count('.') if p else -1,
+                       reverse=True):
+        children = []
+        for child in records_by_path:
+            if child and parent_path(child)[0] == path:
+                model = models_by_path.get(child)
+                null = NullRecord(model) if model else NULL_RECORD
+                children.append((parent_path(child)[1],
+                                 records_by_path[child],
+                                 null))
+        browse = browse_by_path.get(path)
+        model = models_by_path.get(path)
+        linked = set(field for field, __, __ in children)
+        records = {}
+        for record_id, values in values_by_path[path].iteritems():
+            values = dict((field, value) for field, value
+                          in values.iteritems()
+                          if field in linked or
+                          not _is_relational(model, field, value))
+            for field, child_records, null in children:
+                value = values.get(field)
+                if value:
+                    # many2one values are read as tuple (id, name)
+                    values[field] = child_records.get(value[0], null)
+                else:
+                    values[field] = null
+            records[record_id] = PrefetchedRecord(record_id, values,
+                                                  browse=browse)
+        records_by_path[path] = records
+    return records_by_path.get('', {})
@@ -33,6 +33,62 @@ class stock_picking(orm.Model):
                                                       "has been generated."),
     }
 
+    def _auto_init(self, cr, context=None):
+        res = super(stock_picking, self)._auto_init(cr, context=context)
+        # used by the incremental export of the carrier files, only the
+        # delivery orders without file are in the index
+        cr.execute("DROP INDEX IF EXISTS stock_picking_date_done_id_index")
+        cr.execute("SELECT indexname FROM pg_indexes "
+                   "WHERE indexname = "
+                   "'stock_picking_carrier_file_pending_index'")
+        if not cr.fetchone():
+            cr.execute("CREATE INDEX stock_picking_carrier_file_pending_index "
+                       "ON stock_picking (carrier_id, date_done, id) "
+                       "WHERE type = 'out' AND state = 'done' "
+                       "AND NOT COALESCE(carrier_file_generated, false)")
+        return res
+
+    def _get_carrier_file_picking_ids(self, cr, uid, ids, auto=True,
+                                      recreate=False, context=None):
+        """
+        Select the pickings for which a carrier file has to be generated
+        and group them by carrier file configuration, with the filters
+        applied in the database.
+
+        :param list ids: list of ids of pickings for which we need a file
+        :param auto: only select the carrier files set as "auto_export"
+        :param recreate: also select the pickings which already have
+                         their file generated
+        :return: dict {carrier file id: [picking ids]}, the pickings
+                 are kept in the same order than ids
+        """
+        if not ids:
+            return {}
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        conditions = ["p.type = 'out'"]
+        if not recreate:
+            conditions.append("NOT COALESCE(p.carrier_file_generated, false)")
+        if auto:
+            conditions.append("f.auto_export")
+        query = ("SELECT c.carrier_file_id, array_agg(p.id) "
+                 "FROM stock_picking p "
+                 "JOIN delivery_carrier c ON c.id = p.carrier_id "
+                 "JOIN delivery_carrier_file f ON f.id = c.carrier_file_id "
+                 "WHERE p.id IN %%s AND %s "
+                 "GROUP BY c.carrier_file_id" % ' AND '.join(conditions))
+        carrier_file_ids = {}
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(query, (sub_ids,))
+            for carrier_file_id, picking_ids in cr.fetchall():
+                carrier_file_ids.setdefault(carrier_file_id, []).extend(
+                    picking_ids)
+        position = dict((picking_id, index)
+                        for index, picking_id in enumerate(ids))
+        for picking_ids in carrier_file_ids.itervalues():
+            picking_ids.sort(key=position.get)
+        return carrier_file_ids
+
     def generate_carrier_files(self, cr, uid, ids, auto=True,
                                recreate=False, context=None):
         """
@@ -47,31 +103,30 @@ class stock_picking(orm.Model):
                      (on process on picking as instance)
                      or called manually from the wizard. When auto is True,
                      only the carrier files set as "auto_export"
-                     are exported
-        :return: True if successful
+                     are exported. The pickings of the carrier files
+                     set as "async_export" are then only queued.
+        :return: list of tuple (picking ids, error message) for
+                 the files which could not be written, empty when
+                 all the files have been written or queued
         """
         carrier_file_obj = self.pool.get('delivery.carrier.file')
-        carrier_file_ids = {}
-        for picking in self.browse(cr, uid, ids, context):
-            if picking.type != 'out':
-                continue
-            if not recreate and picking.carrier_file_generated:
-                continue
-            carrier = picking.carrier_id
-            if not carrier or not carrier.carrier_file_id:
-                continue
-            if auto and not carrier.carrier_file_id.auto_export:
-                continue
-            p_carrier_file_id = picking.carrier_id.carrier_file_id.id
-            carrier_file_ids.setdefault(p_carrier_file_id, []).\
-                append(picking.id)
-
+        export_queue_obj = self.pool.get('delivery.carrier.file.export.queue')
+        carrier_file_ids = self._get_carrier_file_picking_ids(
+            cr, uid, ids, auto=auto, recreate=recreate, context=context)
+        failures = []
         for carrier_file_id, carrier_picking_ids\
                 in carrier_file_ids.iteritems():
-            carrier_file_obj.generate_files(cr, uid, carrier_file_id,
-                                            carrier_picking_ids,
-                                            context=context)
-        return True
+            carrier_file = carrier_file_obj.browse(cr, uid, carrier_file_id,
+                                                   context=context)
+            if auto and carrier_file.async_export:
+                export_queue_obj.enqueue(cr, uid, carrier_file_id,
+                                         carrier_picking_ids,
+                                         context=context)
+                continue
+            failures += carrier_file_obj.generate_files(
+                cr, uid, carrier_file_id, carrier_picking_ids,
+                context=context)
+        return failures
 
     def action_done(self, cr, uid, ids, context=None):
         result = super(stock_picking, self).action_done(cr, uid, ids,
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+import unittest2
+
+from ..generator.file_generator import (CarrierFileGenerator,
+                                        new_file_generator)
+
+
+class test_file_generator_registry(unittest2.TestCase):
+
+    """ Test the registration of the carrier file generators """
+
+    def test_registered_by_carrier_type(self):
+        class TypedGenerator(CarrierFileGenerator):
+            carrier_type = 'test_registry_typed'
+
+        generator = new_file_generator('test_registry_typed')
+        self.assertIsInstance(generator, TypedGenerator)
+        self.assertIs(new_file_generator('test_registry_typed'), generator)
+
+    def test_nested_subclass_replaces_parent(self):
+        """ A subclass inheriting the carrier_type replaces its parent """
+        class ParentGenerator(CarrierFileGenerator):
+            carrier_type = 'test_registry_nested'
+
+        self.assertIs(type(new_file_generator('test_registry_nested')),
+                      ParentGenerator)
+
+        class ChildGenerator(ParentGenerator):
+            def _get_rows(self, picking, configuration):
+                return []
+
+        self.assertIs(type(new_file_generator('test_registry_nested')),
+                      ChildGenerator)
+
+    def test_carrier_for(self):
+        class MatchingGenerator(CarrierFileGenerator):
+            @classmethod
+            def carrier_for(cls, carrier_name):
+                return carrier_name == 'test_registry_matching'
+
+        self.assertIsInstance(new_file_generator('test_registry_matching'),
+                              MatchingGenerator)
+
+    def test_unknown_carrier_type(self):
+        with self.assertRaises(ValueError):
+            new_file_generator('test_registry_unknown')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+from StringIO import StringIO
+
+import unittest2
+
+from ..generator.base_line import BaseLine
+from ..fixed_width_writer import FixedWidthWriter
+
+
+class FixedLine(BaseLine):
+    fields = (('reference', 6),
+              ('', 2),
+              ('weight', 5))
+    field_alignments = {'weight': 'right'}
+    encoding = 'latin-1'
+
+
+class test_fixed_width_writer(unittest2.TestCase):
+
+    """ Test the writer of fixed width records """
+
+    def _write(self, rows, line_class=FixedLine, **kwargs):
+        stream = StringIO()
+        FixedWidthWriter(stream, line_class, **kwargs).writerows(rows)
+        return stream.getvalue()
+
+    def _line(self, **values):
+        line = FixedLine()
+        for field, value in values.iteritems():
+            setattr(line, field, value)
+        return line.get_fields()
+
+    def test_padding_and_alignment(self):
+        """ Columns are padded on the right, or on the left
+        when they are aligned on the right """
+        row = self._line(reference=u'OUT1', weight=u'1.5')
+        self.assertEqual(self._write([row]), 'OUT1    ' + '  1.5\n')
+
+    def test_padding_character(self):
+        """ The padding character of the line class is used """
+        class ZeroLine(FixedLine):
+            padding = '0'
+        row = self._line(reference=u'OUT1', weight=u'1.5')
+        self.assertEqual(self._write([row], line_class=ZeroLine),
+                         'OUT10000' + '001.5\n')
+
+    def test_truncation(self):
+        """ Values longer than their column are cut """
+        row = self._line(reference=u'OUT/00001', weight=u'123456')
+        self.assertEqual(self._write([row]), 'OUT/00  12345\n')
+
+    def test_empty_values(self):
+        """ Empty values are written as padding """
+        row = self._line(reference=False, weight=u'')
+        self.assertEqual(self._write([row]), ' ' * 13 + '\n')
+
+    def test_encoding(self):
+        """ Records are encoded with the encoding of the line class,
+        the widths being counted in characters """
+        row = self._line(reference=u'Z\xf6e', weight=u'1')
+        self.assertEqual(self._write([row]), 'Z\xf6e     ' + '    1\n')
+        row = self._line(reference='Z\xc3\xb6e', weight=u'1')
+        self.assertEqual(self._write([row]), 'Z\xf6e     ' + '    1\n')
+        self.assertEqual(self._write([row], encoding='utf-8'),
+                         'Z\xc3\xb6e     ' + '    1\n')
+
+    def test_encoding_errors(self):
+        """ Characters missing in the encoding raise an error
+        unless the errors handling is changed """
+        row = self._line(reference=u'€', weight=u'1')
+        with self.assertRaises(UnicodeEncodeError):
+            self._write([row])
+        self.assertEqual(self._write([row], errors='replace'),
+                         '?       ' + '    1\n')
+
+    def test_blocks(self):
+        """ Rows are written by blocks, with the line terminator """
+        rows = [self._line(reference=u'%d' % index, weight=u'1')
+                for index in range(5)]
+        stream = StringIO()
+        writer = FixedWidthWriter(stream, FixedLine, lineterminator='\r\n')
+        writer.block_size = 2
+        writer.writerows(iter(rows))
+        lines = stream.getvalue().split('\r\n')
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[4], '4       ' + '    1')
+        self.assertEqual(lines[5], '')
+
+    def test_missing_width(self):
+        """ Every column must have a width """
+        class NoWidthLine(BaseLine):
+            fields = (('reference', 6),
+                      'weight')
+        with self.assertRaises(ValueError):
+            FixedWidthWriter(StringIO(), NoWidthLine)
+
+    def test_wrong_alignment(self):
+        """ The alignment is left or right """
+        class CenterLine(FixedLine):
+            field_alignments = {'weight': 'center'}
+        with self.assertRaises(ValueError):
+            FixedWidthWriter(StringIO(), CenterLine)
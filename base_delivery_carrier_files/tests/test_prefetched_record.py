@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+import openerp.tests.common as common
+
+from ..generator.prefetched_record import NullRecord
+
+
+class PartnerGenerator(object):
+    """ Minimal file generator declaring the fields to prefetch """
+    prefetch_fields = {
+        '': ['name'],
+        'partner_id': ['name', 'title'],
+        'partner_id.country_id': ['code'],
+    }
+
+
+class test_prefetch_pickings(common.TransactionCase):
+
+    """ Test the records prefetched for the carrier file generators """
+
+    def setUp(self):
+        super(test_prefetch_pickings, self).setUp()
+        cr, uid = self.cr, self.uid
+        self.CarrierFile = self.registry('delivery.carrier.file')
+        self.Picking = self.registry('stock.picking')
+        self.Partner = self.registry('res.partner')
+        title_id = self.registry('res.partner.title').create(
+            cr, uid, {'name': 'Doctor', 'domain': 'contact'})
+        self.parent_id = self.Partner.create(
+            cr, uid, {'name': 'Parent Company', 'is_company': True})
+        self.partner_id = self.Partner.create(
+            cr, uid,
+            {'name': 'Carrier File Partner',
+             'title': title_id,
+             'parent_id': self.parent_id,
+             'country_id': False})
+        self.picking_id = self.Picking.create(
+            cr, uid, {'partner_id': self.partner_id, 'type': 'out'})
+        self.empty_picking_id = self.Picking.create(
+            cr, uid, {'type': 'out'})
+
+    def _prefetch(self, picking_ids):
+        return self.CarrierFile._prefetch_pickings(
+            self.cr, self.uid, PartnerGenerator(), picking_ids)
+
+    def test_prefetched_fields(self):
+        """ The records are in the order of the ids with their fields """
+        picking, empty_picking = self._prefetch([self.picking_id,
+                                                 self.empty_picking_id])
+        self.assertEqual(picking.id, self.picking_id)
+        self.assertEqual(empty_picking.id, self.empty_picking_id)
+        self.assertEqual(picking.partner_id.id, self.partner_id)
+        self.assertEqual(picking.partner_id.name, 'Carrier File Partner')
+
+    def test_relation_not_prefetched(self):
+        """ A relation read but not prefetched is browsed, not a tuple """
+        picking = self._prefetch([self.picking_id])[0]
+        self.assertEqual(picking.partner_id.title.name, 'Doctor')
+        self.assertEqual(picking.partner_id.parent_id.name,
+                         'Parent Company')
+        self.assertEqual(picking.partner_id.parent_id.id, self.parent_id)
+
+    def test_null_record_chaining(self):
+        """ Empty many2one can be followed like a browse_null """
+        picking, empty_picking = self._prefetch([self.picking_id,
+                                                 self.empty_picking_id])
+        country = picking.partner_id.country_id
+        self.assertIsInstance(country, NullRecord)
+        self.assertFalse(country)
+        self.assertIsNone(country.code)
+        partner = empty_picking.partner_id
+        self.assertFalse(partner)
+        self.assertIsNone(partner.name)
+        self.assertFalse(partner.country_id)
+        self.assertIsNone(partner.country_id.code)
+        self.assertFalse(partner.title)
+        self.assertIsNone(partner.title.name)
+        self.assertEqual(partner.child_ids, [])
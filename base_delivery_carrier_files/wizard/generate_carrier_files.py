@@ -45,10 +45,15 @@ class DeliveryCarrierFileGenerate(orm.TransientModel):
                  "for selected picking even if they already had one.\n"
                  "By default, delivery orders with existing file will be "
                  "skipped."),
+        'state': fields.selection([('draft', 'Draft'),
+                                   ('done', 'Done')],
+                                  'State', readonly=True),
+        'failures': fields.text('Failures', readonly=True),
     }
 
     _defaults = {
         'picking_ids': _get_picking_ids,
+        'state': 'draft',
     }
 
     def action_generate(self, cr, uid, ids, context=None):
@@ -62,10 +67,33 @@ class DeliveryCarrierFileGenerate(orm.TransientModel):
 
         picking_obj = self.pool['stock.picking']
         picking_ids = [picking.id for picking in form.picking_ids]
-        picking_obj.generate_carrier_files(cr, uid,
-                                           picking_ids,
-                                           auto=False,
-                                           recreate=form.recreate,
-                                           context=context)
+        failures = picking_obj.generate_carrier_files(cr, uid,
+                                                      picking_ids,
+                                                      auto=False,
+                                                      recreate=form.recreate,
+                                                      context=context)
+        if not failures:
+            return {'type': 'ir.actions.act_window_close'}
 
-        return {'type': 'ir.actions.act_window_close'}
+        # show the files which could not be generated in the wizard
+        failed_ids = [picking_id for file_picking_ids, __ in failures
+                      for picking_id in file_picking_ids]
+        names = dict(picking_obj.name_get(cr, uid, failed_ids,
+                                          context=context))
+        message = '\n'.join(
+            _('%s: %s') % (', '.join(names[picking_id]
+                                     for picking_id in file_picking_ids),
+                           error)
+            for file_picking_ids, error in failures)
+        self.write(cr, uid, [form.id],
+                   {'state': 'done', 'failures': message},
+                   context=context)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': form.id,
+            'view_type': 'form',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': context,
+        }
@@ -20,3 +20,4 @@
 ##############################################################################
 
 from . import carrier_file  # noqa
+from . import ir_attachment  # noqa
@@ -20,10 +20,31 @@
 ##############################################################################
 
 import base64
+import hashlib
+import os
+import tempfile
 
 from openerp.osv import orm, fields
 
 
+class HashingFile(object):
+
+    """
+    Wrap a file handle and compute the SHA1 and the size
+    of the data written in it
+    """
+
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        self.sha1.update(data)
+        self.size += len(data)
+        self.file_handle.write(data)
+
+
 class CarrierFile(orm.Model):
     _inherit = 'delivery.carrier.file'
 
@@ -51,20 +72,123 @@ class CarrierFile(orm.Model):
             res_id = context['picking_id']
         else:
             res_id = False
-        return {'name': "%s_%s" % (carrier_file.name, filename),
+        vals = {'name': "%s_%s" % (carrier_file.name, filename),
                 'datas_fname': filename,
-                'datas': base64.encodestring(file_content),
                 'parent_id': carrier_file.document_directory_id.id,
                 'type': 'binary',
                 'res_model': 'stock.picking.out',
                 'res_id': res_id}
+        if file_content is not None:
+            vals['datas'] = base64.encodestring(file_content)
+        return vals
+
+    def _store_in_filestore(self, cr, uid, file_content, context=None):
+        """
+        Write the content of the file straight in the filestore of the
+        attachments, the same way ir.attachment stores its files, without
+        encoding it in base64.
+
+        :param file_content: content of the file to write or
+                             a function writing the content in
+                             a file handle when rows are streamed
+        :return: tuple (store_fname, file_size, checksum) or None when
+                 the attachments are stored in the database
+        """
+        location = self.pool['ir.config_parameter'].get_param(
+            cr, uid, 'ir_attachment.location')
+        if not location:
+            return None
+        attachment_obj = self.pool['ir.attachment']
+        if not callable(file_content):
+            checksum = hashlib.sha1(file_content).hexdigest()
+            fname = checksum[:3] + '/' + checksum
+            if os.path.exists(attachment_obj._full_path(cr, uid,
+                                                        location, fname)):
+                # same content already stored
+                return fname, len(file_content), checksum
+        root_path = attachment_obj._full_path(cr, uid, location, '')
+        if not os.path.isdir(root_path):
+            os.makedirs(root_path)
+        # the name of the file is its checksum, so write in a temporary
+        # file of the filestore and move it once completely written
+        with tempfile.NamedTemporaryFile(dir=root_path,
+                                         delete=False) as temp_file:
+            try:
+                hashing_file = HashingFile(temp_file)
+                if callable(file_content):
+                    file_content(hashing_file)
+                else:
+                    hashing_file.write(file_content)
+            except Exception:
+                os.remove(temp_file.name)
+                raise
+        checksum = hashing_file.sha1.hexdigest()
+        fname = checksum
+        # scatter files across 1024 dirs like ir.attachment
+        fname = fname[:3] + '/' + fname
+        full_path = attachment_obj._full_path(cr, uid, location, fname)
+        dirname = os.path.dirname(full_path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        if os.path.exists(full_path):
+            # same content already stored
+            os.remove(temp_file.name)
+        else:
+            os.rename(temp_file.name, full_path)
+        return fname, hashing_file.size, checksum
+
+    def _find_same_attachment(self, cr, uid, vals, checksum, context=None):
+        """
+        Search an attachment already created for the same record in the
+        same directory with exactly the same content
+
+        :param dict vals: values of the attachment to create
+        :param str checksum: SHA1 of the content of the file
+        :return: id of the attachment or None
+        """
+        attachment_ids = self.pool['ir.attachment'].search(
+            cr, uid,
+            [('carrier_file_checksum', '=', checksum),
+             ('parent_id', '=', vals['parent_id']),
+             ('res_model', '=', vals['res_model']),
+             ('res_id', '=', vals['res_id'])],
+            limit=1, context=context)
+        return attachment_ids[0] if attachment_ids else None
 
     def _write_file(self, cr, uid, carrier_file, filename, file_content,
                     context=None):
         if carrier_file.write_mode == 'document':
-            vals = self._prepare_attachment(carrier_file, filename,
-                                            file_content, context=context)
-            self.pool['ir.attachment'].create(cr, uid, vals, context=context)
+            attachment_obj = self.pool['ir.attachment']
+            stored = self._store_in_filestore(cr, uid, file_content,
+                                              context=context)
+            if stored is not None:
+                # the content is only stored once in the filestore, the
+                # new attachment is only a new reference to the file
+                store_fname, file_size, checksum = stored
+                vals = self._prepare_attachment(carrier_file, filename,
+                                                None, context=context)
+                vals.update({'store_fname': store_fname,
+                             'file_size': file_size})
+            else:
+                if callable(file_content):
+                    # rows are streamed: write them in a temporary file
+                    # rather than building them in memory
+                    with tempfile.TemporaryFile() as file_handle:
+                        file_content(file_handle)
+                        file_handle.seek(0)
+                        file_content = file_handle.read()
+                checksum = hashlib.sha1(file_content).hexdigest()
+                vals = self._prepare_attachment(carrier_file, filename,
+                                                None, context=context)
+            vals['carrier_file_checksum'] = checksum
+            # the same file is already attached: it has been
+            # recreated without any change
+            if self._find_same_attachment(cr, uid, vals, checksum,
+                                          context=context):
+                return True
+            if stored is None:
+                vals['datas'] = base64.encodestring(file_content)
+            attachment_obj.create(cr, uid, vals, context=context)
             return True
         else:
             return (super(CarrierFile, self)
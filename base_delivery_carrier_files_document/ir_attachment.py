@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import orm, fields
+
+
+class IrAttachment(orm.Model):
+    _inherit = 'ir.attachment'
+
+    _columns = {
+        'carrier_file_checksum': fields.char('Carrier File Checksum',
+                                             size=40, readonly=True,
+                                             select=True,
+                                             help='SHA1 of the content of '
+                                                  'the generated carrier '
+                                                  'file.'),
+    }
+
+    def copy(self, cr, uid, id, default=None, context=None):
+        if default is None:
+            default = {}
+        default.setdefault('carrier_file_checksum', False)
+        return super(IrAttachment, self).copy(cr, uid, id, default,
+                                              context=context)
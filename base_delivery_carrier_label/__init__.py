@@ -21,3 +21,5 @@
 from . import delivery
 from . import stock
 from . import carrier_account
+from . import ir_attachment
+from . import res_partner
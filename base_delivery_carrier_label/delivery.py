@@ -19,7 +19,7 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
-from openerp import models, fields, api
+from openerp import models, fields, api, tools, SUPERUSER_ID
 
 
 class DeliveryCarrierTemplateOption(models.Model):
@@ -37,6 +37,14 @@ class DeliveryCarrierTemplateOption(models.Model):
              "than in the name field."
     )
 
+    @api.multi
+    def unlink(self):
+        res = super(DeliveryCarrierTemplateOption, self).unlink()
+        # the carrier options are deleted in cascade by the database
+        # without their unlink, clear the options cached on the carriers
+        self.env['delivery.carrier'].clear_caches()
+        return res
+
 
 class DeliveryCarrierOption(models.Model):
     """ Option selected for a carrier method
@@ -72,6 +80,27 @@ class DeliveryCarrierOption(models.Model):
              "option (if attribute is defined in the view)"
     )
 
+    @api.model
+    def create(self, vals):
+        res = super(DeliveryCarrierOption, self).create(vals)
+        # the default and mandatory options are cached on the carriers,
+        # clear them once modified so they can't be cached again with
+        # the old values
+        self.env['delivery.carrier'].clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(DeliveryCarrierOption, self).write(vals)
+        self.env['delivery.carrier'].clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(DeliveryCarrierOption, self).unlink()
+        self.env['delivery.carrier'].clear_caches()
+        return res
+
 
 class DeliveryCarrier(models.Model):
     _inherit = 'delivery.carrier'
@@ -96,11 +125,40 @@ class DeliveryCarrier(models.Model):
         string='Option',
     )
 
+    @api.cr_uid
+    @tools.ormcache(skiparg=3)
+    def _get_carrier_option_ids(self, cr, uid, carrier_id):
+        """ Returns the ids of the default and of the mandatory options
+        of a carrier as a tuple (default ids, mandatory ids)
+
+        The result is cached until an option is modified.
+
+        """
+        option_obj = self.pool['delivery.carrier.option']
+        option_ids = option_obj.search(cr, SUPERUSER_ID,
+                                       [('carrier_id', '=', carrier_id)])
+        default_ids = []
+        mandatory_ids = []
+        for option in option_obj.read(cr, SUPERUSER_ID, option_ids,
+                                      ['mandatory', 'by_default']):
+            if option['mandatory']:
+                mandatory_ids.append(option['id'])
+            if option['mandatory'] or option['by_default']:
+                default_ids.append(option['id'])
+        return tuple(default_ids), tuple(mandatory_ids)
+
     @api.multi
     def default_options(self):
         """ Returns default and available options for a carrier """
-        options = self.env['delivery.carrier.option'].browse()
-        for available_option in self.available_option_ids:
-            if (available_option.mandatory or available_option.by_default):
-                options |= available_option
-        return options
+        option_ids = []
+        for carrier in self:
+            option_ids += self._get_carrier_option_ids(carrier.id)[0]
+        return self.env['delivery.carrier.option'].browse(option_ids)
+
+    @api.multi
+    def mandatory_options(self):
+        """ Returns mandatory options for a carrier """
+        option_ids = []
+        for carrier in self:
+            option_ids += self._get_carrier_option_ids(carrier.id)[1]
+        return self.env['delivery.carrier.option'].browse(option_ids)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Sébastien BEAU <sebastien.beau@akretion.com>
+#    Copyright (C) 2012-TODAY Akretion <http://www.akretion.com>.
+#    Copyright 2014 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import hashlib
+import os
+import tempfile
+
+from openerp import models, api
+
+
+class HashingFile(object):
+    """ Wrap a file handle and compute the SHA1 and the size
+    of the data written in it """
+
+    def __init__(self, file_handle):
+        self.file_handle = file_handle
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        self.sha1.update(data)
+        self.size += len(data)
+        self.file_handle.write(data)
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.model
+    def _filestore_fname(self, checksum):
+        """ Return the name of the file of a content in the filestore
+        from its SHA1, the same way as ``_get_path`` """
+        # retro compatibility
+        fname = checksum[:3] + '/' + checksum
+        if os.path.isfile(self._full_path(fname)):
+            return fname
+        # scatter files across 256 dirs
+        return checksum[:2] + '/' + checksum
+
+    @api.model
+    def _store_in_filestore(self, content):
+        """ Write a file straight in the filestore of the attachments,
+        the same way ir.attachment stores its files, without encoding it
+        in base64 nor keeping it in memory when it is written by a
+        function.
+
+        :param content: content of the file or a function writing
+                        the content in a file handle
+        :return: tuple (store_fname, file_size, checksum) or None when
+                 the attachments are stored in the database
+
+        """
+        if self._storage() == 'db':
+            return None
+        if not callable(content):
+            checksum = hashlib.sha1(content).hexdigest()
+            fname = self._filestore_fname(checksum)
+            if os.path.exists(self._full_path(fname)):
+                # same content already stored
+                return fname, len(content), checksum
+        root_path = self._full_path('')
+        if not os.path.isdir(root_path):
+            os.makedirs(root_path)
+        # the name of the file is its checksum, so write in a temporary
+        # file of the filestore and move it once completely written
+        with tempfile.NamedTemporaryFile(dir=root_path,
+                                         delete=False) as temp_file:
+            try:
+                hashing_file = HashingFile(temp_file)
+                if callable(content):
+                    content(hashing_file)
+                else:
+                    hashing_file.write(content)
+            except Exception:
+                os.remove(temp_file.name)
+                raise
+        checksum = hashing_file.sha1.hexdigest()
+        fname = self._filestore_fname(checksum)
+        full_path = self._full_path(fname)
+        dirname = os.path.dirname(full_path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        if os.path.exists(full_path):
+            # same content already stored
+            os.remove(temp_file.name)
+        else:
+            os.rename(temp_file.name, full_path)
+        return fname, hashing_file.size, checksum
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Sébastien BEAU <sebastien.beau@akretion.com>
+#    Copyright (C) 2012-TODAY Akretion <http://www.akretion.com>.
+#    Copyright 2014 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+from openerp import models, api
+
+# fields of the partners changing the delivery address of a company
+SENDER_ADDRESS_FIELDS = ('type', 'parent_id', 'child_ids',
+                         'is_company', 'active')
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    @api.multi
+    def _is_company_address(self):
+        """ Returns True if one of the partners is the partner of a
+        company or one of its contacts """
+        partners = self.sudo()
+        company_partners = partners.env['res.company'].search(
+            []).mapped('partner_id')
+        while partners:
+            if partners & company_partners:
+                return True
+            partners = partners.mapped('parent_id')
+        return False
+
+    @api.model
+    @api.returns('self', lambda value: value.id)
+    def create(self, vals):
+        partner = super(ResPartner, self).create(vals)
+        if partner._is_company_address():
+            # the sender addresses of the companies are cached
+            self.env['stock.picking'].clear_caches()
+        return partner
+
+    @api.multi
+    def write(self, vals):
+        if not any(field in vals for field in SENDER_ADDRESS_FIELDS):
+            return super(ResPartner, self).write(vals)
+        # the partners can be added to or removed from the contacts of
+        # a company, check before and after the write
+        address_changed = self._is_company_address()
+        res = super(ResPartner, self).write(vals)
+        if address_changed or self._is_company_address():
+            self.env['stock.picking'].clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        address_changed = self._is_company_address()
+        res = super(ResPartner, self).unlink()
+        if address_changed:
+            self.env['stock.picking'].clear_caches()
+        return res
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    @api.multi
+    def write(self, vals):
+        res = super(ResCompany, self).write(vals)
+        if 'partner_id' in vals:
+            # the sender addresses of the companies are cached
+            self.env['stock.picking'].clear_caches()
+        return res
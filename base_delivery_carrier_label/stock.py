@@ -21,29 +21,71 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
-from openerp import models, fields, api, exceptions, _
+from openerp import models, fields, api, exceptions, tools, _
+from openerp import SUPERUSER_ID
 import openerp.addons.decimal_precision as dp
 
+# operators of name_search for which a package is found by its tracking
+POSITIVE_NAME_OPERATORS = ('ilike', 'like', '=', '=ilike', '=like')
+
 
 class StockQuantPackage(models.Model):
     _inherit = 'stock.quant.package'
 
-    parcel_tracking = fields.Char(string='Parcel Tracking')
+    parcel_tracking = fields.Char(string='Parcel Tracking', index=True)
     weight = fields.Float(
         digits=dp.get_precision('Stock Weight'),
         help="Total weight of the package in kg, including the "
              "weight of the logistic unit."
     )
+    complete_path = fields.Char(
+        string='Package Name with Parents',
+        compute='_compute_complete_path',
+        store=True,
+    )
+    tracking_complete_name = fields.Char(
+        string='Package Name with Tracking',
+        compute='_compute_tracking_complete_name',
+        store=True,
+        index=True,
+    )
 
     @api.multi
-    def _complete_name(self, name, args):
-        res = super(StockQuantPackage, self)._complete_name(name, args)
+    @api.depends('name', 'parent_id.complete_path')
+    def _compute_complete_path(self):
+        # recomputed on all the descendants when a package is renamed
         for pack in self:
+            name = pack.name or ''
+            if pack.parent_id:
+                name = '%s / %s' % (pack.parent_id.complete_path, name)
+            pack.complete_path = name
+
+    @api.multi
+    @api.depends('complete_path', 'parcel_tracking', 'weight')
+    def _compute_tracking_complete_name(self):
+        for pack in self:
+            name = pack.complete_path or ''
             if pack.parcel_tracking:
-                res[pack.id] += ' [%s]' % pack.parcel_tracking
+                name += ' [%s]' % pack.parcel_tracking
             if pack.weight:
-                res[pack.id] += ' %s kg' % pack.weight
-        return res
+                name += ' %s kg' % pack.weight
+            pack.tracking_complete_name = name
+
+    @api.multi
+    def _complete_name(self, name, args):
+        return dict((pack.id, pack.tracking_complete_name) for pack in self)
+
+    @api.model
+    def name_search(self, name='', args=None, operator='ilike', limit=100):
+        """ A tracking number scanned at the dock finds its package """
+        if name and operator in POSITIVE_NAME_OPERATORS:
+            packages = self.search(
+                [('parcel_tracking', '=', name)] + (args or []),
+                limit=limit)
+            if packages:
+                return packages.name_get()
+        return super(StockQuantPackage, self).name_search(
+            name=name, args=args, operator=operator, limit=limit)
 
 
 class StockPicking(models.Model):
@@ -102,6 +144,9 @@ class StockPicking(models.Model):
            file: file as string
            file_type: string of file type like 'PDF'
            (optional)
+           file_base64: file already encoded in base64, as received
+                        from some carriers, it is stored as is
+                        and used instead of file
            tracking_id: tracking_id if picking lines have tracking_id and
                         if label generator creates shipping label per
                         pack
@@ -118,38 +163,69 @@ class StockPicking(models.Model):
         return labels
 
     @api.multi
-    def generate_labels(self, package_ids=None):
-        """ Generate the labels.
+    def generate_shipping_labels_batch(self, package_ids=None):
+        """ Generate the shipping labels of all the pickings at once
 
-        A list of tracking ids can be given, in that case it will generate
-        the labels only of these packages.
+        By default, generate_shipping_labels is called for each picking.
+        This method can be inherited by the carrier modules to handle
+        all their pickings in one batch, and call super for the other
+        pickings.
 
-        """
-        label_obj = self.env['shipping.label']
+        :param package_ids: optional list of ``stock.quant.package`` ids
+                             only packs in this list will have their label
+                             printed (all are generated when None)
 
+        :return: dict {picking: list of labels} where the labels are
+                 the dict returned by generate_shipping_labels
+
+        """
+        labels = {}
         for pick in self:
             if package_ids:
-                shipping_labels = pick.generate_shipping_labels(
+                labels[pick] = pick.generate_shipping_labels(
                     package_ids=package_ids
                 )
             else:
-                shipping_labels = pick.generate_shipping_labels()
-            for label in shipping_labels:
-                data = {
-                    'name': label['name'],
-                    'res_id': pick.id,
-                    'res_model': 'stock.picking',
-                    'datas': label['file'].encode('base64'),
-                    'file_type': label['file_type'],
-                }
-                if label.get('package_id'):
-                    data['package_id'] = label['package_id']
-                context_attachment = self.env.context.copy()
-                # remove default_type setted for stock_picking
-                # as it would try to define default value of attachement
-                if 'default_type' in context_attachment:
-                    del context_attachment['default_type']
-                label_obj.with_context(context_attachment).create(data)
+                labels[pick] = pick.generate_shipping_labels()
+        return labels
+
+    @api.multi
+    def _prepare_shipping_label(self, label):
+        """ Return the values to create a shipping.label for a label
+
+        :param label: dict of the label as returned by
+                      generate_shipping_labels
+        """
+        self.ensure_one()
+        if 'file_base64' in label:
+            datas = label['file_base64']
+        else:
+            datas = label['file'].encode('base64')
+        data = {
+            'name': label['name'],
+            'res_id': self.id,
+            'res_model': 'stock.picking',
+            'datas': datas,
+            'file_type': label['file_type'],
+        }
+        if label.get('package_id'):
+            data['package_id'] = label['package_id']
+        return data
+
+    @api.multi
+    def generate_labels(self, package_ids=None):
+        """ Generate the labels.
+
+        A list of tracking ids can be given, in that case it will generate
+        the labels only of these packages.
+
+        """
+        labels = self.generate_shipping_labels_batch(package_ids=package_ids)
+        values = []
+        for pick in self:
+            for label in labels.get(pick, []):
+                values.append(pick._prepare_shipping_label(label))
+        self.env['shipping.label'].create_multi(values)
         return True
 
     @api.multi
@@ -187,9 +263,8 @@ class StockPicking(models.Model):
         if not self.carrier_id:
             return
         carrier = self.carrier_id
-        for available_option in carrier.available_option_ids:
-            if (available_option.mandatory and
-                    available_option not in self.option_ids):
+        for available_option in carrier.mandatory_options():
+            if available_option not in self.option_ids:
                 # XXX the client does not allow to modify the field that
                 # triggered the onchange:
                 # https://github.com/odoo/odoo/issues/2693#issuecomment-56825399
@@ -218,19 +293,36 @@ class StockPicking(models.Model):
     def _get_packages_from_picking(self):
         """ Get all the packages from the picking """
         self.ensure_one()
-        operation_obj = self.env['stock.pack.operation']
-        packages = self.env['stock.quant.package'].browse()
-        operations = operation_obj.search(
+        return self._get_packages_by_picking()[self]
+
+    @api.multi
+    def _get_packages_by_picking(self):
+        """ Get all the packages of the pickings
+
+        The packages of all the pickings are read at once.
+
+        :return: dict {picking: recordset of stock.quant.package}
+
+        """
+        package_ids = dict((pick.id, []) for pick in self)
+        operations = self.env['stock.pack.operation'].search_read(
             ['|',
              ('package_id', '!=', False),
              ('result_package_id', '!=', False),
-             ('picking_id', '=', self.id)]
+             ('picking_id', 'in', self.ids)],
+            ['picking_id', 'package_id', 'result_package_id'],
         )
         for operation in operations:
             # Take the destination package. If empty, the package is
             # moved so take the source one.
-            packages |= operation.result_package_id or operation.package_id
-        return packages
+            package = (operation['result_package_id'] or
+                       operation['package_id'])
+            pick_package_ids = package_ids[operation['picking_id'][0]]
+            if package[0] not in pick_package_ids:
+                pick_package_ids.append(package[0])
+        package_obj = self.env['stock.quant.package']
+        return dict((pick, package_obj.browse(package_ids[pick.id]))
+                    for pick in self)
 
     @api.multi
     def write(self, vals):
@@ -275,8 +367,26 @@ class StockPicking(models.Model):
             delivery_carrier_label_yourcarrier_yourproject.
         """
         self.ensure_one()
-        partner = self.company_id.partner_id
-        address_id = partner.address_get(adr_pref=['delivery'])['delivery']
+        return self._get_company_sender_address(self.company_id)
+
+    @api.cr_uid
+    @tools.ormcache(skiparg=3)
+    def _get_company_sender_address_id(self, cr, uid, company_id):
+        """ Returns the id of the delivery address of a company
+
+        The result is cached until a company or the partner of a
+        company is modified.
+
+        """
+        company = self.pool['res.company'].browse(cr, SUPERUSER_ID,
+                                                  company_id)
+        return company.partner_id.address_get(
+            adr_pref=['delivery'])['delivery']
+
+    @api.model
+    def _get_company_sender_address(self, company):
+        """ Return the delivery address of a company """
+        address_id = self._get_company_sender_address_id(company.id)
         return self.env['res.partner'].browse(address_id)
 
 
@@ -312,3 +422,81 @@ class ShippingLabel(models.Model):
         required=True,
         ondelete='cascade',
     )
+
+    def _auto_init(self, cr, context=None):
+        res = super(ShippingLabel, self)._auto_init(cr, context=context)
+        # used to find the latest label of the packages
+        cr.execute("SELECT indexname FROM pg_indexes "
+                   "WHERE indexname = 'shipping_label_latest_package_index'")
+        if not cr.fetchone():
+            cr.execute("CREATE INDEX shipping_label_latest_package_index "
+                       "ON shipping_label "
+                       "(file_type, package_id, create_date DESC, id DESC)")
+        return res
+
+    @api.model
+    def _get_latest_label_ids_by_package(self, package_ids, file_type='pdf'):
+        """ Find the latest label of each package with one query
+
+        :param package_ids: list of ``stock.quant.package`` ids
+        :param file_type: type of the labels to find
+        :return: dict {package id: id of its latest label}, the packages
+                 without label are not in the dict
+
+        """
+        package_ids = [package_id for package_id in package_ids
+                       if package_id]
+        if not package_ids:
+            return {}
+        self.env.cr.execute(
+            "SELECT DISTINCT ON (package_id) package_id, id "
+            "FROM shipping_label "
+            "WHERE file_type = %s AND package_id IN %s "
+            "ORDER BY package_id, create_date DESC, id DESC",
+            (file_type, tuple(package_ids))
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_latest_label_ids_by_picking(self, picking_ids, file_type='pdf',
+                                         res_model='stock.picking'):
+        """ Find the latest label without package of each picking
+        with one query
+
+        :param picking_ids: list of picking ids
+        :param file_type: type of the labels to find
+        :param res_model: model of the pickings the labels are attached
+                          to, no filter on the model when None
+        :return: dict {picking id: id of its latest label}, the pickings
+                 without label are not in the dict
+
+        """
+        if not picking_ids:
+            return {}
+        query = ("SELECT DISTINCT ON (a.res_id) a.res_id, l.id "
+                 "FROM shipping_label l "
+                 "JOIN ir_attachment a ON a.id = l.attachment_id "
+                 "WHERE l.file_type = %s AND l.package_id IS NULL "
+                 "AND a.res_id IN %s ")
+        params = [file_type, tuple(picking_ids)]
+        if res_model:
+            query += "AND a.res_model = %s "
+            params.append(res_model)
+        query += "ORDER BY a.res_id, l.create_date DESC, l.id DESC"
+        self.env.cr.execute(query, params)
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def create_multi(self, values):
+        """ Create several labels at once
+
+        :param values: list of dict of values, one for each label
+        :return: recordset of the created labels
+
+        """
+        context_attachment = dict(self.env.context)
+        # remove default_type setted for stock_picking
+        # as it would try to define default value of attachement
+        context_attachment.pop('default_type', None)
+        label_obj = self.with_context(context_attachment)
+        return self.browse([label_obj.create(vals).id for vals in values])
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Guewen Baconnier
+#    Copyright 2012 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+"""
+Compare the per-row throughput of the FixedWidthWriter with
+the UnicodeWriter (CSV) on a TNT-like layout.
+
+It does not need an OpenERP server, run it with:
+
+    python benchmarks/fixed_width_writer.py [number of rows]
+"""
+
+import os
+import sys
+import timeit
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+MODULE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'base_delivery_carrier_files')
+sys.path[0:0] = [os.path.join(MODULE_PATH, 'generator'),
+                 os.path.join(MODULE_PATH, 'csv_writer'),
+                 os.path.join(MODULE_PATH, 'fixed_width_writer')]
+
+from base_line import BaseLine  # noqa
+from unicode_writer import UnicodeWriter  # noqa
+from fixed_width_writer import FixedWidthWriter  # noqa
+
+
+class BenchLine(BaseLine):
+    fields = (('reference', 15),
+              ('name', 30),
+              ('street1', 30),
+              ('city', 30),
+              ('zip', 9),
+              ('country', 2),
+              ('phone', 16),
+              ('mail', 50),
+              ('weight', 8))
+    field_alignments = {'weight': 'right'}
+    encoding = 'latin-1'
+
+
+def _rows(count):
+    rows = []
+    for index in xrange(count):
+        line = BenchLine()
+        line.reference = u'OUT/%05d' % index
+        line.name = u'Zoé Müller'
+        line.street1 = u'Rue de la Gare 12'
+        line.city = u'Lausanne'
+        line.zip = u'1003'
+        line.country = u'CH'
+        line.phone = u'+41 21 619 10 10'
+        line.mail = u'zoe.muller@example.com'
+        line.weight = u'%.2f' % (index / 10.,)
+        rows.append(line.get_fields())
+    return rows
+
+
+def _write_csv(rows):
+    file_handle = StringIO.StringIO()
+    UnicodeWriter(file_handle, delimiter=';', lineterminator='\n',
+                  encoding='latin-1').writerows(rows)
+    return file_handle.getvalue()
+
+
+def _write_fixed_width(rows):
+    file_handle = StringIO.StringIO()
+    FixedWidthWriter(file_handle, BenchLine).writerows(rows)
+    return file_handle.getvalue()
+
+
+def main(count=10000, repeat=5):
+    rows = _rows(count)
+    for name, writer in (('UnicodeWriter (csv)', _write_csv),
+                         ('FixedWidthWriter', _write_fixed_width)):
+        duration = min(timeit.repeat(lambda: writer(rows),
+                                     number=1, repeat=repeat))
+        print '%-20s %8.0f rows/s' % (name, count / duration)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
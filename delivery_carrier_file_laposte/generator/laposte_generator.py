@@ -54,9 +54,15 @@ class LaPosteLine(BaseLine):
 
 class LaPosteFileGenerator(CarrierFileGenerator):
 
-    @classmethod
-    def carrier_for(cls, carrier_name):
-        return carrier_name == 'la_poste'
+    carrier_type = 'la_poste'
+
+    prefetch_fields = {
+        '': ['name', 'weight'],
+        'address_id': ['name', 'street', 'street2', 'zip', 'city',
+                       'phone', 'mobile', 'email'],
+        'address_id.partner_id': ['name', 'title'],
+        'address_id.country_id': ['code'],
+    }
 
     def _get_filename_single(self, picking, configuration, extension='csv'):
         return super(LaPosteFileGenerator, self
@@ -90,7 +96,7 @@ class LaPosteFileGenerator(CarrierFileGenerator):
             line.street2 = address.street2
             line.zip = address.zip
             line.city = address.city
-            line.country = address.country_id.code
+            line.country_code = address.country_id.code
             line.phone = address.phone or picking.address_id.mobile
             line.mail = address.email
         line.weight = "%.2f" % (picking.weight,)
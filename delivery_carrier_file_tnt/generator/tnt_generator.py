@@ -51,9 +51,17 @@ class TNTLine(BaseLine):
 
 class TNTFileGenerator(CarrierFileGenerator):
 
-    @classmethod
-    def carrier_for(cls, carrier_name):
-        return carrier_name == 'tnt_express_shipper'
+    carrier_type = 'tnt_express_shipper'
+
+    prefetch_fields = {
+        '': ['name'],
+        'address_id': ['name', 'street', 'street2', 'zip', 'city',
+                       'phone', 'mobile', 'fax', 'email'],
+        'address_id.partner_id': ['name', 'vat'],
+        'address_id.state_id': ['name'],
+        'address_id.country_id': ['code', 'name'],
+        'carrier_id': ['name'],
+    }
 
     def _get_rows(self, picking, configuration):
         """
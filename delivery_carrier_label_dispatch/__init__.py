@@ -19,4 +19,5 @@
 #
 ##############################################################################
 from . import picking_dispatch
+from . import label_job
 from . import wizard
@@ -46,7 +46,10 @@ Contributors
 """,
     'website': 'http://www.camptocamp.com/',
     'data': [
+        'security/ir.model.access.csv',
         'picking_dispatch_view.xml',
+        'label_job_view.xml',
+        'label_job_data.xml',
         'wizard/generate_labels_view.xml',
         'wizard/apply_carrier_view.xml',
     ],
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Author: Yannick Vaucher
+#    Copyright 2013 Camptocamp SA
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+import logging
+
+from openerp.osv import orm, fields
+
+_logger = logging.getLogger(__name__)
+
+
+class PickingDispatchLabelJob(orm.Model):
+
+    """
+    Generation of the labels of a dispatch in background.
+    The labels missing when the job is created are generated by chunks
+    by a scheduled action, then all the labels of the dispatch are merged
+    in a PDF attached to the dispatch.
+    """
+
+    _name = 'picking.dispatch.label.job'
+    _description = 'Dispatch labels generation job'
+    _order = 'id desc'
+
+    def _get_counts(self, cr, uid, ids, field_names, arg, context=None):
+        res = dict((job_id, {'done_count': 0,
+                             'failed_count': 0,
+                             'remaining_count': 0})
+                   for job_id in ids)
+        if not ids:
+            return res
+        count_fields = {'done': 'done_count',
+                        'failed': 'failed_count',
+                        'pending': 'remaining_count'}
+        cr.execute("SELECT job_id, state, count(*) "
+                   "FROM picking_dispatch_label_job_line "
+                   "WHERE job_id IN %s "
+                   "GROUP BY job_id, state",
+                   (tuple(ids),))
+        for job_id, state, count in cr.fetchall():
+            res[job_id][count_fields[state]] = count
+        return res
+
+    _columns = {
+        'dispatch_id': fields.many2one('picking.dispatch',
+                                       'Picking Dispatch',
+                                       required=True, readonly=True,
+                                       ondelete='cascade', select=True),
+        'state': fields.selection([('pending', 'Pending'),
+                                   ('done', 'Done'),
+                                   ('failed', 'Failed')],
+                                  'State', required=True, readonly=True),
+        'generate_new_labels': fields.boolean('Generate new labels',
+                                              readonly=True),
+        'label_workers': fields.integer('Parallel label requests',
+                                        readonly=True),
+        'line_ids': fields.one2many('picking.dispatch.label.job.line',
+                                    'job_id', 'Labels', readonly=True),
+        'done_count': fields.function(_get_counts, type='integer',
+                                      string='Done', multi='counts'),
+        'failed_count': fields.function(_get_counts, type='integer',
+                                        string='Failed', multi='counts'),
+        'remaining_count': fields.function(_get_counts, type='integer',
+                                           string='Remaining',
+                                           multi='counts'),
+        'attachment_id': fields.many2one('ir.attachment', 'Merged Labels',
+                                         readonly=True, ondelete='set null'),
+        'error': fields.text('Error', readonly=True),
+    }
+
+    _defaults = {
+        'state': 'pending',
+        'label_workers': 1,
+    }
+
+    def create_job(self, cr, uid, wizard, dispatch, context=None):
+        """
+        Create a job generating the missing labels of a dispatch
+        with the options of the label generation wizard.
+
+        :param browse_record wizard: delivery.carrier.label.generate
+        :param browse_record dispatch: picking.dispatch
+        :return: id of the job
+        """
+        wizard_obj = self.pool['delivery.carrier.label.generate']
+        packs = wizard_obj._get_packs(cr, uid, wizard, dispatch,
+                                      context=context)
+        missing = wizard_obj._get_missing_labels(wizard, packs)
+        lines = [(0, 0, {'pack_id': pack.id if pack else False,
+                         'picking_id': picking.id})
+                 for pack, picking in missing]
+        return self.create(cr, uid,
+                           {'dispatch_id': dispatch.id,
+                            'generate_new_labels': wizard.generate_new_labels,
+                            'label_workers': wizard.label_workers,
+                            'line_ids': lines},
+                           context=context)
+
+    def action_retry(self, cr, uid, ids, context=None):
+        """ Generate again the labels which failed """
+        line_obj = self.pool['picking.dispatch.label.job.line']
+        line_ids = line_obj.search(cr, uid,
+                                   [('job_id', 'in', ids),
+                                    ('state', '=', 'failed')],
+                                   context=context)
+        line_obj.write(cr, uid, line_ids,
+                       {'state': 'pending', 'error': False},
+                       context=context)
+        return self.write(cr, uid, ids,
+                          {'state': 'pending', 'error': False},
+                          context=context)
+
+    def _line_error(self, cr, uid, line, error, context=None):
+        """ Return the message of the error raised for a line """
+        if isinstance(error, orm.except_orm):
+            wizard_obj = self.pool['delivery.carrier.label.generate']
+            return wizard_obj._label_error(line.pack_id, line.picking_id,
+                                           error).value
+        return unicode(error)
+
+    def _generate_lines(self, cr, uid, job, lines, context=None):
+        """ Generate the labels of a chunk of lines of a job.
+        The job is used as the wizard, it has the same options.
+
+        Each line is generated in a savepoint, a failing line is
+        marked as failed without undoing the labels of the other lines.
+        With parallel label requests, the labels of each picking are
+        committed by a thread and the lines of the pickings which
+        failed are marked as failed. """
+        wizard_obj = self.pool['delivery.carrier.label.generate']
+        line_obj = self.pool['picking.dispatch.label.job.line']
+        picking_obj = self.pool['stock.picking']
+        errors = {}
+        if job.label_workers <= 1:
+            for line in lines:
+                package_ids = [line.pack_id.id] if line.pack_id else None
+                try:
+                    with cr.savepoint():
+                        picking_obj.generate_labels(
+                            cr, uid, [line.picking_id.id],
+                            package_ids=package_ids, context=context)
+                except Exception as e:
+                    # the values written in the savepoint are cached
+                    self.invalidate_cache(cr, uid, context=context)
+                    errors[line.id] = e
+        else:
+            missing = [(line.pack_id, line.picking_id) for line in lines]
+            picking_errors = wizard_obj._generate_labels_in_threads(
+                cr, uid, job.label_workers, missing, context=context)
+            for line in lines:
+                if picking_errors[line.picking_id.id] is not None:
+                    errors[line.id] = picking_errors[line.picking_id.id]
+
+        for line in lines:
+            error = errors.get(line.id)
+            if error is None:
+                continue
+            _logger.error("Could not generate the label of the line %s "
+                          "of the dispatch label job %s: %s",
+                          line.id, job.id, error)
+            line_obj.write(cr, uid, [line.id],
+                           {'state': 'failed',
+                            'error': self._line_error(cr, uid, line, error,
+                                                      context=context)},
+                           context=context)
+        line_obj.write(cr, uid,
+                       [line.id for line in lines if line.id not in errors],
+                       {'state': 'done'}, context=context)
+
+    def _attach_labels(self, cr, uid, job, context=None):
+        """ Merge the labels of the dispatch of a job in a PDF """
+        wizard_obj = self.pool['delivery.carrier.label.generate']
+        packs = wizard_obj._get_packs(cr, uid, job, job.dispatch_id,
+                                      context=context)
+        labels = (label for pack, picking, label in packs if label)
+        return wizard_obj._attach_labels(cr, uid, job.dispatch_id, labels,
+                                         context=context)
+
+    def _process_job(self, cr, uid, job_id, chunk_size=50, context=None):
+        """
+        Generate the labels of a job by chunks of chunk_size labels
+        and attach the merged labels to the dispatch.
+        The transaction is committed after each chunk, the failing
+        labels are marked as failed in their chunk.
+        """
+        line_obj = self.pool['picking.dispatch.label.job.line']
+        while True:
+            line_ids = line_obj.search(cr, uid,
+                                       [('job_id', '=', job_id),
+                                        ('state', '=', 'pending')],
+                                       limit=chunk_size, context=context)
+            if not line_ids:
+                break
+            job = self.browse(cr, uid, job_id, context=context)
+            lines = line_obj.browse(cr, uid, line_ids, context=context)
+            self._generate_lines(cr, uid, job, lines, context=context)
+            cr.commit()
+
+        job = self.browse(cr, uid, job_id, context=context)
+        try:
+            attachment_id = self._attach_labels(cr, uid, job,
+                                                context=context)
+        except Exception as e:
+            _logger.exception("Could not merge the labels of the "
+                              "dispatch label job %s", job_id)
+            cr.rollback()
+            self.write(cr, uid, [job_id],
+                       {'state': 'failed', 'error': unicode(e)},
+                       context=context)
+        else:
+            self.write(cr, uid, [job_id],
+                       {'state': 'done', 'attachment_id': attachment_id},
+                       context=context)
+        cr.commit()
+
+    def run_label_jobs(self, cr, uid, chunk_size=50, context=None):
+        """
+        Scheduled action: process the pending dispatch label jobs
+        in the order they have been created.
+        """
+        job_ids = self.search(cr, uid, [('state', '=', 'pending')],
+                              order='id', context=context)
+        for job_id in job_ids:
+            self._process_job(cr, uid, job_id, chunk_size=chunk_size,
+                              context=context)
+        return True
+
+
+class PickingDispatchLabelJobLine(orm.Model):
+
+    """ Label to generate in a dispatch label job """
+
+    _name = 'picking.dispatch.label.job.line'
+    _description = 'Dispatch labels generation job line'
+    _order = 'id'
+
+    _columns = {
+        'job_id': fields.many2one('picking.dispatch.label.job', 'Job',
+                                  required=True, readonly=True,
+                                  ondelete='cascade', select=True),
+        'pack_id': fields.many2one('stock.quant.package', 'Pack',
+                                   readonly=True),
+        'picking_id': fields.many2one('stock.picking', 'Delivery Order',
+                                      required=True, readonly=True,
+                                      ondelete='cascade'),
+        'state': fields.selection([('pending', 'Pending'),
+                                   ('done', 'Done'),
+                                   ('failed', 'Failed')],
+                                  'State', required=True, readonly=True),
+        'error': fields.text('Error', readonly=True),
+    }
+
+    _defaults = {
+        'state': 'pending',
+    }
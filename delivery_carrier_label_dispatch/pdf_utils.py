@@ -18,13 +18,184 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import hashlib
 from StringIO import StringIO
-from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (ArrayObject,
+                            DecodedStreamObject,
+                            DictionaryObject,
+                            EncodedStreamObject,
+                            IndirectObject,
+                            NameObject,
+                            NumberObject,
+                            StreamObject,
+                            )
 
 
-def assemble_pdf(pdf_list):
+class PdfStreamWriter(object):
     """
-    Assemble a list of pdf
+    Write a PDF document in a stream, page by page
+
+    The objects of a page are written as soon as the page is added,
+    so only the PDF being read is kept in memory. The objects are
+    shared by content: a font or a logo embedded in every label is
+    written once in the document.
+    """
+
+    CATALOG_NUMBER = 1
+    PAGES_NUMBER = 2
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._offset = 0
+        # object number -> offset of the object in the stream
+        self._xref = {}
+        self._next_number = self.PAGES_NUMBER + 1
+        # sha1 of the written objects -> reference, to share them
+        self._shared = {}
+        self._page_refs = []
+        self._pages_ref = IndirectObject(self.PAGES_NUMBER, 0, None)
+        self._write('%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.stream.write(data)
+        self._offset += len(data)
+
+    def _reserve(self):
+        ref = IndirectObject(self._next_number, 0, None)
+        self._next_number += 1
+        return ref
+
+    @staticmethod
+    def _serialize(obj):
+        output = StringIO()
+        obj.writeToStream(output, None)
+        return output.getvalue()
+
+    def _write_object(self, ref, data):
+        self._xref[ref.idnum] = self._offset
+        self._write('%d 0 obj\n' % ref.idnum)
+        self._write(data)
+        self._write('\nendobj\n')
+
+    def _copy(self, obj, memo):
+        """ Copy an object read in a PDF, its indirect objects are
+        written in the stream and replaced by their new references """
+        if isinstance(obj, IndirectObject):
+            return self._copy_indirect(obj, memo)
+        if isinstance(obj, StreamObject):
+            if '/Filter' in obj:
+                copy = EncodedStreamObject()
+            else:
+                copy = DecodedStreamObject()
+            copy._data = obj._data
+        elif isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+        elif isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value, memo) for value in obj)
+        else:
+            return obj
+        for key, value in obj.iteritems():
+            copy[key] = self._copy(value, memo)
+        return copy
+
+    def _copy_indirect(self, ref, memo):
+        key = (ref.idnum, ref.generation)
+        if key in memo:
+            new_ref = memo[key]
+            if new_ref is None:
+                # reference cycle, the object is being copied:
+                # number it now, it cannot be shared
+                new_ref = memo[key] = self._reserve()
+            return new_ref
+        memo[key] = None
+        data = self._serialize(self._copy(ref.getObject(), memo))
+        new_ref = memo[key]
+        if new_ref is None:
+            digest = hashlib.sha1(data).digest()
+            if digest in self._shared:
+                new_ref = memo[key] = self._shared[digest]
+                return new_ref
+            new_ref = memo[key] = self._shared[digest] = self._reserve()
+        self._write_object(new_ref, data)
+        return new_ref
+
+    def add_pdf(self, pdf):
+        """ Append the pages of a PDF
+
+        :param pdf: content of the PDF or file object
+        :return: number of pages added
+        """
+        if isinstance(pdf, basestring):
+            pdf = StringIO(pdf)
+        reader = PdfFileReader(pdf)
+        return self.add_pages(reader, range(reader.getNumPages()))
+
+    def add_pages(self, reader, indexes, memo=None):
+        """ Append some pages of a PDF
+
+        :param reader: PdfFileReader of the PDF
+        :param indexes: indexes of the pages to append
+        :param memo: dict of the objects of the reader already written,
+                     to give when several calls are made for a reader
+        :return: number of pages added
+        """
+        if memo is None:
+            memo = {}
+        pages = [reader.getPage(index) for index in indexes]
+        # the pages may be referenced by the other objects (links,
+        # annotations): number them first
+        page_refs = []
+        for page in pages:
+            page_ref = self._reserve()
+            if page.indirectRef is not None:
+                key = (page.indirectRef.idnum, page.indirectRef.generation)
+                memo[key] = page_ref
+            page_refs.append(page_ref)
+        for page, page_ref in zip(pages, page_refs):
+            copy = DictionaryObject()
+            for key, value in page.iteritems():
+                if key == '/Parent':
+                    continue
+                copy[key] = self._copy(value, memo)
+            copy[NameObject('/Parent')] = self._pages_ref
+            self._write_object(page_ref, self._serialize(copy))
+            self._page_refs.append(page_ref)
+        return len(pages)
+
+    def close(self):
+        """ Write the pages tree, the catalog and the cross-reference
+        table which end the document """
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(self._page_refs),
+            NameObject('/Count'): NumberObject(len(self._page_refs)),
+        })
+        self._write_object(self._pages_ref, self._serialize(pages))
+        catalog_ref = IndirectObject(self.CATALOG_NUMBER, 0, None)
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): self._pages_ref,
+        })
+        self._write_object(catalog_ref, self._serialize(catalog))
+        xref_offset = self._offset
+        size = self._next_number
+        self._write('xref\n0 %d\n' % size)
+        self._write('0000000000 65535 f \n')
+        for number in range(1, size):
+            self._write('%010d 00000 n \n' % self._xref[number])
+        trailer = DictionaryObject({
+            NameObject('/Size'): NumberObject(size),
+            NameObject('/Root'): catalog_ref,
+        })
+        self._write('trailer\n')
+        self._write(self._serialize(trailer))
+        self._write('\nstartxref\n%d\n%%%%EOF\n' % xref_offset)
+
+
+def write_pdf(pdf_list, stream):
+    """
+    Assemble a list of pdf and write the result in a stream
     """
     # Even though we are using PyPDF2 we can't use PdfFileMerger
     # as this issue still exists in mostly used wkhtmltohpdf reports version
@@ -37,14 +208,18 @@ def assemble_pdf(pdf_list):
     #     merger.write(merged_pdf)
     #     return merged_pdf.read(), 'pdf'
 
-    output = PdfFileWriter()
+    output = PdfStreamWriter(stream)
     for pdf in pdf_list:
         if not pdf:
             continue
-        reader = PdfFileReader(StringIO(pdf))
+        output.add_pdf(pdf)
+    output.close()
+
 
-        for page in range(reader.getNumPages()):
-            output.addPage(reader.getPage(page))
+def assemble_pdf(pdf_list):
+    """
+    Assemble a list of pdf
+    """
     s = StringIO()
-    output.write(s)
+    write_pdf(pdf_list, s)
     return s.getvalue()
@@ -39,8 +39,29 @@ class PickingDispatch(Model):
         'option_ids': fields.many2many(
             'delivery.carrier.option',
             string='Options'),
+        'label_job_ids': fields.one2many(
+            'picking.dispatch.label.job', 'dispatch_id',
+            string='Label Jobs', readonly=True),
+        'label_attachment_id': fields.many2one(
+            'ir.attachment', 'Merged Labels',
+            readonly=True, ondelete='set null'),
+        'label_manifest': fields.text(
+            'Merged Labels Manifest', readonly=True,
+            help="Labels of the merged labels PDF with their checksum "
+                 "and number of pages."),
     }
 
+    def copy(self, cr, uid, id, default=None, context=None):
+        if default is None:
+            default = {}
+        default.update({'label_job_ids': [],
+                        'label_attachment_id': False,
+                        'label_manifest': False,
+                        })
+        return super(PickingDispatch, self).copy(cr, uid, id,
+                                                 default=default,
+                                                 context=context)
+
     def action_set_options(self, cr, uid, ids, context=None):
         """ Apply options to picking of the dispatch
 
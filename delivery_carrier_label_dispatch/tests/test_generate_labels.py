@@ -18,9 +18,16 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+import json
+from StringIO import StringIO
+
+from PyPDF2 import PdfFileReader
+
 import openerp.tests.common as common
 from openerp.addons import get_module_resource
 
+from ..pdf_utils import PdfStreamWriter, assemble_pdf
+
 
 class test_generate_labels(common.TransactionCase):
 
@@ -83,7 +90,9 @@ class test_generate_labels(common.TransactionCase):
         with file(dummy_pdf_path) as dummy_pdf:
             label = dummy_pdf.read()
 
-        self.ShippingLabel.create(
+        self.label_pdf = label
+        self.picking_out_2_id = picking_out_2_id
+        self.label_1_id = self.ShippingLabel.create(
             cr, uid,
             {'name': 'picking_out_1',
              'res_id': picking_out_1_id,
@@ -92,7 +101,7 @@ class test_generate_labels(common.TransactionCase):
              'file_type': 'pdf',
              })
 
-        self.ShippingLabel.create(
+        self.label_2_id = self.ShippingLabel.create(
             cr, uid,
             {'name': 'picking_out_2',
              'res_id': picking_out_2_id,
@@ -122,3 +131,103 @@ class test_generate_labels(common.TransactionCase):
         wizard = self.DeliveryCarrierLabelGenerate.browse(
             cr, uid, wizard_id, context=None)
         assert wizard.label_pdf_file
+
+    def test_01_assemble_pdf(self):
+        """ Check the merged pdf shares the resources of the labels """
+        dummy_pdf_path = get_module_resource('delivery_carrier_label_dispatch',
+                                             'tests', 'dummy.pdf')
+        with file(dummy_pdf_path) as dummy_pdf:
+            label = dummy_pdf.read()
+        merged = assemble_pdf([label, None, label, label])
+        reader = PdfFileReader(StringIO(merged))
+        self.assertEqual(reader.getNumPages(), 3)
+        self.assertLess(len(merged), len(label) * 2)
+
+    def _spy_pdf_writer(self):
+        """ Record the labels read and the pages copied from the
+        previous merged pdf """
+        calls = {'add_pdf': [], 'add_pages': []}
+        add_pdf = PdfStreamWriter.__dict__['add_pdf']
+        add_pages = PdfStreamWriter.__dict__['add_pages']
+        reading = []
+
+        def spy_add_pdf(writer, pdf):
+            calls['add_pdf'].append(pdf)
+            reading.append(pdf)
+            try:
+                return add_pdf(writer, pdf)
+            finally:
+                reading.pop()
+
+        def spy_add_pages(writer, reader, indexes, memo=None):
+            if not reading:
+                # the pages of a label read are added by add_pdf
+                calls['add_pages'].append(list(indexes))
+            return add_pages(writer, reader, indexes, memo=memo)
+
+        PdfStreamWriter.add_pdf = spy_add_pdf
+        PdfStreamWriter.add_pages = spy_add_pages
+        self.addCleanup(setattr, PdfStreamWriter, 'add_pdf', add_pdf)
+        self.addCleanup(setattr, PdfStreamWriter, 'add_pages', add_pages)
+        return calls
+
+    def _attach_labels(self, label_ids):
+        cr, uid = self.cr, self.uid
+        dispatch = self.PickingDispatch.browse(cr, uid,
+                                               self.picking_dispatch_id)
+        labels = self.ShippingLabel.browse(cr, uid, label_ids)
+        return self.DeliveryCarrierLabelGenerate._attach_labels(
+            cr, uid, dispatch, labels)
+
+    def _read_attachment(self, attachment_id):
+        attachment = self.registry('ir.attachment').browse(
+            self.cr, self.uid, attachment_id)
+        return attachment.store_fname, attachment.datas
+
+    def test_02_attach_labels_again(self):
+        """ Check the merged pdf is kept when its labels did not change
+        and only the changed labels are read when it is merged again """
+        cr, uid = self.cr, self.uid
+        calls = self._spy_pdf_writer()
+        attachment_id = self._attach_labels([self.label_1_id,
+                                             self.label_2_id])
+        self.assertEqual(len(calls['add_pdf']), 2)
+        self.assertEqual(calls['add_pages'], [])
+        store_fname, datas = self._read_attachment(attachment_id)
+        reader = PdfFileReader(StringIO(datas.decode('base64')))
+        self.assertEqual(reader.getNumPages(), 2)
+
+        # no change: the attachment is returned untouched
+        calls['add_pdf'][:] = []
+        self.assertEqual(
+            self._attach_labels([self.label_1_id, self.label_2_id]),
+            attachment_id)
+        self.assertEqual(calls['add_pdf'], [])
+        self.assertEqual(calls['add_pages'], [])
+        self.assertEqual(self._read_attachment(attachment_id),
+                         (store_fname, datas))
+
+        # a new label replaces the second one: only it is read
+        label_3_id = self.ShippingLabel.create(
+            cr, uid,
+            {'name': 'picking_out_2_new',
+             'res_id': self.picking_out_2_id,
+             'res_model': 'stock.picking.out',
+             'datas': self.label_pdf.encode('base64'),
+             'file_type': 'pdf',
+             })
+        self.assertEqual(
+            self._attach_labels([self.label_1_id, label_3_id]),
+            attachment_id)
+        self.assertEqual(len(calls['add_pdf']), 1)
+        # the page of the first label is copied from the previous pdf
+        self.assertEqual(calls['add_pages'], [[0]])
+        datas = self._read_attachment(attachment_id)[1]
+        reader = PdfFileReader(StringIO(datas.decode('base64')))
+        self.assertEqual(reader.getNumPages(), 2)
+        dispatch = self.PickingDispatch.browse(cr, uid,
+                                               self.picking_dispatch_id)
+        manifest = json.loads(dispatch.label_manifest)
+        self.assertEqual([(label_id, pages)
+                          for label_id, __, pages in manifest],
+                         [(self.label_1_id, 1), (label_3_id, 1)])
@@ -18,13 +18,26 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
-from operator import attrgetter
-from itertools import groupby
+import base64
+import json
+import tempfile
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
 
+from PyPDF2 import PdfFileReader
+
+from openerp import api
+from openerp import sql_db
 from openerp.osv import orm, fields
 from openerp.tools.translate import _
 
-from ..pdf_utils import assemble_pdf
+from ..pdf_utils import PdfStreamWriter
+
+# maximum number of labels requested at the same time to the carriers,
+# each request uses its own connection to the database
+MAX_LABEL_WORKERS = 8
 
 
 class DeliveryCarrierLabelGenerate(orm.TransientModel):
@@ -48,100 +61,402 @@ class DeliveryCarrierLabelGenerate(orm.TransientModel):
             help="If this option is used, new labels will be     "
                  "generated for the packs even if they already have one.\n"
                  "The default is to use the existing label."),
+        'label_workers': fields.integer(
+            'Parallel label requests',
+            help="Number of pickings whose labels are requested at the "
+                 "same time to the carriers by the generation in "
+                 "background, at most %d.\n"
+                 "Keep it within the rate limit of your carriers.\n"
+                 "When above 1, the labels of each picking are committed "
+                 "as soon as they are generated." % MAX_LABEL_WORKERS),
+        'background': fields.boolean(
+            'Generate in background',
+            help="The labels are generated and merged by a scheduled "
+                 "action. The progress is shown on each dispatch and the "
+                 "merged PDF is attached to the dispatch once done."),
     }
 
     _defaults = {
         'dispatch_ids': _get_dispatch_ids,
         'generate_new_labels': False,
+        'label_workers': 1,
+        'background': False,
     }
 
+    _sql_constraints = [
+        ('label_workers_range',
+         'CHECK (label_workers BETWEEN 1 AND %d)' % MAX_LABEL_WORKERS,
+         'The number of parallel label requests must be between 1 and %d.'
+         % MAX_LABEL_WORKERS),
+    ]
+
     def _get_packs(self, cr, uid, wizard, dispatch, context=None):
-        moves = sorted(dispatch.move_ids, key=attrgetter('tracking_id.name'))
-        for pack, moves in groupby(moves, key=attrgetter('tracking_id')):
-            pack_label = self._find_pack_label(cr, uid, wizard, pack,
-                                               context=context)
-            yield pack, list(moves), pack_label
+        """ Return the packs of a dispatch with their picking and label
 
-    def _find_picking_label(self, cr, uid, wizard, picking, context=None):
-        label_obj = self.pool['shipping.label']
-        domain = [('file_type', '=', 'pdf'),
-                  ('res_id', '=', picking.id),
-                  ('tracking_id', '=', False),
-                  ]
-        label_id = label_obj.search(cr, uid, domain, order='create_date DESC',
-                                    limit=1, context=context)
-        if not label_id:
-            return None
-        return label_obj.browse(cr, uid, label_id[0], context=context)
-
-    def _find_pack_label(self, cr, uid, wizard, pack, context=None):
+        The packs are the ``stock.quant.package`` of the pickings of the
+        dispatch, a picking without package is considered as one pack.
+        The packages of the pickings and the latest labels are read at
+        once.
+
+        :return: list of tuple (pack, picking, label) sorted by pack name,
+                 pack is None for the pickings without package and label
+                 is None when there is no label yet
+        """
+        picking_obj = self.pool['stock.picking']
         label_obj = self.pool['shipping.label']
-        domain = [('file_type', '=', 'pdf'),
-                  ('tracking_id', '=', pack.id),
-                  ]
-        label_id = label_obj.search(cr, uid, domain, order='create_date DESC',
-                                    limit=1, context=context)
-        if not label_id:
-            return None
-        return label_obj.browse(cr, uid, label_id[0], context=context)
+        cr.execute("SELECT DISTINCT picking_id "
+                   "FROM stock_move "
+                   "WHERE dispatch_id = %s "
+                   "AND picking_id IS NOT NULL "
+                   "ORDER BY picking_id",
+                   (dispatch.id,))
+        picking_ids = [row[0] for row in cr.fetchall()]
+        pickings = picking_obj.browse(cr, uid, picking_ids, context=context)
+        packages_by_picking = pickings._get_packages_by_picking()
+        rows = []
+        seen = set()
+        for picking in pickings:
+            packages = packages_by_picking[picking]
+            if not packages:
+                rows.append((None, picking))
+            for package in packages:
+                # a package spread over several pickings gets the label
+                # of its first picking
+                if package.id not in seen:
+                    seen.add(package.id)
+                    rows.append((package, picking))
+        rows.sort(key=lambda row: (row[0] is not None,
+                                   row[0].name if row[0] else '',
+                                   row[0].id if row[0] else 0,
+                                   row[1].id))
+
+        pack_label_ids = label_obj._get_latest_label_ids_by_package(
+            cr, uid, [pack.id for pack, __ in rows if pack],
+            context=context)
+        picking_label_ids = label_obj._get_latest_label_ids_by_picking(
+            cr, uid, [picking.id for pack, picking in rows if not pack],
+            res_model=None, context=context)
+        label_ids = pack_label_ids.values() + picking_label_ids.values()
+        labels = dict((label.id, label) for label in
+                      label_obj.browse(cr, uid, label_ids, context=context))
+        plan = []
+        for pack, picking in rows:
+            if pack:
+                label_id = pack_label_ids.get(pack.id)
+            else:
+                label_id = picking_label_ids.get(picking.id)
+            plan.append((pack, picking, labels.get(label_id)))
+        return plan
+
+    def _label_error(self, pack, picking, error):
+        picking_name = _('Picking: %s') % picking.name
+        pack_num = _('Pack: %s') % pack.name if pack else ''
+        return orm.except_orm(
+            error.name,
+            _('%s %s - %s') % (picking_name, pack_num, error.value))
+
+    def _request_labels(self, dbname, uid, picking_id, package_ids,
+                        context=None):
+        """ Generate the labels of the packs of a picking in a thread
+
+        The labels are generated exactly as in the main thread, with
+        a cursor of its own, committed once the labels are created.
+        Only used by the background jobs, which own their transaction.
+
+        :return: the error raised by the generation or None
+        """
+        picking_obj = self.pool['stock.picking']
+        with api.Environment.manage():
+            cr = sql_db.db_connect(dbname).cursor()
+            try:
+                picking_obj.generate_labels(cr, uid, [picking_id],
+                                            package_ids=package_ids,
+                                            context=context)
+                cr.commit()
+                return None
+            except Exception as e:
+                cr.rollback()
+                return e
+            finally:
+                cr.close()
+
+    def _generate_labels_in_threads(self, cr, uid, workers, missing,
+                                    context=None):
+        """ Generate the labels of the packs without label from a pool
+        of threads, one picking per thread
+
+        Each thread commits the labels of its picking, so this is only
+        called by the background jobs, between two commits of their
+        transaction. The packs of a picking are generated by the same
+        thread as the carriers write on the picking.
+
+        :param workers: number of threads
+        :param missing: list of tuple (pack, picking)
+        :return: dict {picking id: error raised for the picking or None}
+        """
+        package_ids = OrderedDict()
+        for pack, picking in missing:
+            pick_package_ids = package_ids.setdefault(picking.id, [])
+            if pack:
+                pick_package_ids.append(pack.id)
+        request = partial(self._request_labels, cr.dbname, uid,
+                          context=context)
+        pool = ThreadPool(min(workers, MAX_LABEL_WORKERS, len(package_ids)))
+        try:
+            errors = pool.map(lambda args: request(*args),
+                              [(picking_id, ids or None)
+                               for picking_id, ids
+                               in package_ids.iteritems()])
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(package_ids, errors))
+
+    def _generate_missing_labels(self, cr, uid, wizard, missing,
+                                 context=None):
+        """ Generate the labels of the packs without label
+
+        The labels are generated one pack at a time in the transaction.
+
+        :param missing: list of tuple (pack, picking)
+        """
+        picking_obj = self.pool['stock.picking']
+        for pack, picking in missing:
+            # generate the label of the pack
+            if pack:
+                package_ids = [pack.id]
+            else:
+                package_ids = None
+            try:
+                picking_obj.generate_labels(
+                    cr, uid, [picking.id],
+                    package_ids=package_ids,
+                    context=context)
+            except orm.except_orm as e:
+                raise self._label_error(pack, picking, e)
+
+    def _get_missing_labels(self, wizard, packs):
+        """ Return the packs which need a label to be generated
+
+        :param packs: list of tuple (pack, picking, label) as returned
+                      by _get_packs
+        :return: list of tuple (pack, picking)
+        """
+        return [(pack, picking)
+                for pack, picking, label in packs
+                if not label or wizard.generate_new_labels]
 
     def _get_all_pdf(self, cr, uid, wizard, dispatch, context=None):
-        for pack, moves, label in self._get_packs(cr, uid, wizard, dispatch,
-                                                  context=context):
+        packs = self._get_packs(cr, uid, wizard, dispatch, context=context)
+        missing = self._get_missing_labels(wizard, packs)
+        if not missing:
+            for pack, picking, label in packs:
+                yield label
+            return
+
+        self._generate_missing_labels(cr, uid, wizard, missing,
+                                      context=context)
+        # find the generated labels at once
+        label_obj = self.pool['shipping.label']
+        pack_label_ids = label_obj._get_latest_label_ids_by_package(
+            cr, uid, [pack.id for pack, picking in missing if pack],
+            context=context)
+        picking_label_ids = label_obj._get_latest_label_ids_by_picking(
+            cr, uid, [picking.id for pack, picking in missing if not pack],
+            res_model=None, context=context)
+        for pack, picking, label in packs:
             if not label or wizard.generate_new_labels:
-                picking_out_obj = self.pool['stock.picking.out']
-                picking = moves[0].picking_id
-                # generate the label of the pack
-                if pack:
-                    tracking_ids = [pack.id]
-                else:
-                    tracking_ids = None
-                try:
-                    picking_out_obj.generate_labels(
-                        cr, uid, [picking.id],
-                        tracking_ids=tracking_ids,
-                        context=context)
-                except orm.except_orm as e:
-                    picking_name = _('Picking: %s') % picking.name
-                    pack_num = _('Pack: %s') % pack.name if pack else ''
-                    raise orm.except_orm(
-                        e.name,
-                        _('%s %s - %s') % (picking_name, pack_num, e.value))
                 if pack:
-                    label = self._find_pack_label(cr, uid, wizard, pack,
-                                                  context=context)
+                    label_id = pack_label_ids.get(pack.id)
                 else:
-                    label = self._find_picking_label(cr, uid, wizard, picking,
-                                                     context=context)
-                if not label:
+                    label_id = picking_label_ids.get(picking.id)
+                if not label_id:
                     continue  # no label could be generated
+                label = label_obj.browse(cr, uid, label_id, context=context)
             yield label
 
+    def _store_pdf(self, cr, uid, write, context=None):
+        """
+        Merge the labels in a temporary file and return the values
+        of the attachment storing it.
+
+        When the attachments are stored in a filestore, the file
+        is written in the filestore and is never read in memory.
+
+        :param write: function writing the merged labels in a stream
+        """
+        attachment_obj = self.pool['ir.attachment']
+        stored = attachment_obj._store_in_filestore(cr, uid, write,
+                                                    context=context)
+        if stored is not None:
+            store_fname, file_size, __ = stored
+            return {'store_fname': store_fname,
+                    'file_size': file_size,
+                    'db_datas': False}
+        with tempfile.TemporaryFile() as merged_pdf:
+            write(merged_pdf)
+            merged_pdf.seek(0)
+            return {'datas': base64.encodestring(merged_pdf.read())}
+
+    def _label_manifest(self, cr, uid, labels, context=None):
+        """ Return the checksums of the labels
+
+        The checksum is the name of the file of the label in the
+        filestore, which is its SHA1, or the MD5 of its content when
+        it is stored in the database.
+
+        :return: list of [label id, checksum]
+        """
+        if not labels:
+            return []
+        cr.execute("SELECT l.id, COALESCE(a.store_fname, md5(a.db_datas)) "
+                   "FROM shipping_label l "
+                   "JOIN ir_attachment a ON a.id = l.attachment_id "
+                   "WHERE l.id IN %s",
+                   (tuple(label.id for label in labels),))
+        checksums = dict(cr.fetchall())
+        return [[label.id, checksums[label.id]] for label in labels]
+
+    def _open_attachment(self, cr, uid, attachment, context=None):
+        """ Return a file object on the content of an attachment,
+        the file of the filestore is opened when there is one """
+        if attachment.store_fname:
+            attachment_obj = self.pool['ir.attachment']
+            return open(attachment_obj._full_path(cr, uid,
+                                                  attachment.store_fname),
+                        'rb')
+        return StringIO(attachment.datas.decode('base64'))
+
+    def _merge_labels(self, labels, manifest, previous_manifest,
+                      previous_file, stream):
+        """ Merge the labels in a stream
+
+        The pages of the labels which are in the previous manifest are
+        copied from the previous merged PDF, the other labels are read.
+
+        :param manifest: list of [label id, checksum] of the labels
+        :param previous_manifest: list of [label id, checksum, pages]
+                                  of the previous merged PDF
+        :param previous_file: file object of the previous merged PDF
+        :return: list of the number of pages of each label
+        """
+        previous_pages = {}
+        index = 0
+        for label_id, checksum, count in previous_manifest:
+            previous_pages[(label_id, checksum)] = (index, count)
+            index += count
+
+        output = PdfStreamWriter(stream)
+        previous_reader = None
+        previous_memo = {}
+        counts = []
+        for label, (label_id, checksum) in zip(labels, manifest):
+            if checksum and (label_id, checksum) in previous_pages:
+                if previous_reader is None:
+                    previous_reader = PdfFileReader(previous_file)
+                start, count = previous_pages[(label_id, checksum)]
+                output.add_pages(previous_reader,
+                                 range(start, start + count),
+                                 memo=previous_memo)
+            elif label.datas:
+                # the labels are decoded and merged one at a time
+                count = output.add_pdf(label.datas.decode('base64'))
+            else:
+                count = 0
+            counts.append(count)
+        output.close()
+        return counts
+
+    def _attach_labels(self, cr, uid, dispatch, labels, context=None):
+        """ Merge the labels in a PDF attached to the dispatch
+
+        The dispatch keeps the manifest of the labels of its merged PDF.
+        When the labels did not change, the PDF is kept as is. Otherwise,
+        the pages of the unchanged labels are copied from the previous
+        PDF and only the new or changed labels are read.
+
+        :param labels: iterable of shipping labels
+        :return: id of the attachment
+        """
+        attachment_obj = self.pool['ir.attachment']
+        labels = list(labels)
+        manifest = self._label_manifest(cr, uid, labels, context=context)
+        attachment = dispatch.label_attachment_id
+        previous_manifest = []
+        if attachment and dispatch.label_manifest:
+            previous_manifest = json.loads(dispatch.label_manifest)
+            if [entry[:2] for entry in previous_manifest] == manifest:
+                return attachment.id
+
+        reused = set(tuple(entry[:2]) for entry in previous_manifest)
+        reused.intersection_update(tuple(entry) for entry in manifest)
+        previous_file = None
+        if reused:
+            previous_file = self._open_attachment(cr, uid, attachment,
+                                                  context=context)
+        page_counts = []
+
+        def write(stream):
+            page_counts[:] = self._merge_labels(labels, manifest,
+                                                previous_manifest,
+                                                previous_file, stream)
+        try:
+            data = self._store_pdf(cr, uid, write, context=context)
+        finally:
+            if previous_file is not None:
+                previous_file.close()
+
+        if attachment:
+            old_fname = attachment.store_fname
+            attachment_obj.write(cr, uid, [attachment.id], data,
+                                 context=context)
+            attachment_id = attachment.id
+            if (old_fname and 'store_fname' in data and
+                    old_fname != data['store_fname']):
+                # the file is removed when no attachment uses it anymore
+                attachment_obj._file_delete(cr, uid, old_fname)
+        else:
+            data.update({
+                'name': dispatch.name + '.pdf',
+                'res_id': dispatch.id,
+                'res_model': 'picking.dispatch',
+            })
+            attachment_id = attachment_obj.create(cr, uid, data,
+                                                  context=context)
+        manifest = [entry + [count]
+                    for entry, count in zip(manifest, page_counts)]
+        self.pool['picking.dispatch'].write(
+            cr, uid, [dispatch.id],
+            {'label_attachment_id': attachment_id,
+             'label_manifest': json.dumps(manifest)},
+            context=context)
+        return attachment_id
+
     def action_generate_labels(self, cr, uid, ids, context=None):
         """
         Call the creation of the delivery carrier label
         of the missing labels and get the existing ones
         Then merge all of them in a single PDF
 
+        In background, a job is created for each dispatch instead.
+
         """
         this = self.browse(cr, uid, ids, context=context)[0]
         if not this.dispatch_ids:
             raise orm.except_orm(_('Error'), _('No picking dispatch selected'))
 
-        attachment_obj = self.pool.get('ir.attachment')
+        if this.background:
+            job_obj = self.pool['picking.dispatch.label.job']
+            for dispatch in this.dispatch_ids:
+                job_obj.create_job(cr, uid, this, dispatch, context=context)
+            return {
+                'type': 'ir.actions.act_window_close',
+            }
 
         for dispatch in this.dispatch_ids:
             labels = self._get_all_pdf(cr, uid, this, dispatch,
                                        context=context)
-            labels = (label.datas for label in labels)
-            labels = (label.decode('base64') for label in labels if labels)
-            data = {
-                'name': dispatch.name + '.pdf',
-                'res_id': dispatch.id,
-                'res_model': 'picking.dispatch',
-                'datas': assemble_pdf(labels).encode('base64'),
-            }
-            attachment_obj.create(cr, uid, data, context=context)
+            self._attach_labels(cr, uid, dispatch, labels, context=context)
 
         return {
             'type': 'ir.actions.act_window_close',
@@ -88,7 +88,8 @@ class StockPicking(models.Model):
 
         def info_from_label(label):
             tracking_number = label['tracking_number']
-            return {'file': label['binary'].decode('base64'),
+            # the label is received in base64 and stored in base64
+            return {'file_base64': label['binary'],
                     'file_type': label['file_type'],
                     'name': tracking_number + '.' + label['file_type'],
                     }
@@ -89,7 +89,7 @@ class TestPostlogistics(common.TransactionCase):
             res = self.picking._generate_postlogistics_label(
                 webservice_class=FakeWS
             )
-            expected = [{'file': '',
+            expected = [{'file_base64': '',
                          'file_type': 'pdf',
                          'name': 'XYZ.pdf',
                          'package_id': False}]